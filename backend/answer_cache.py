@@ -0,0 +1,50 @@
+import re
+import hashlib
+import logging
+from datetime import datetime
+
+from database import read_with_fallback
+from background import defer_write
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r'[^\w\s]')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = _PUNCT_RE.sub(' ', (query or '').lower())
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def query_key(query, scope):
+    return hashlib.sha256(f"{scope}:{normalize_query(query)}".encode('utf-8')).hexdigest()
+
+
+def store_answer(query, scope, response_text):
+    """Remember the latest good answer to a question for stale fallback (written in the background)"""
+    defer_write('''
+        INSERT INTO answer_cache (query_key, scope, query, response, created_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (query_key) DO UPDATE
+        SET response = EXCLUDED.response, created_at = EXCLUDED.created_at
+    ''', (query_key(query, scope), scope, query, response_text, datetime.now()))
+
+
+def get_cached_answer(query, scope):
+    """Return (response, created_at) for a previously answered question, or None"""
+    try:
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT response, created_at FROM answer_cache WHERE query_key = %s
+            ''', (query_key(query, scope),))
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+
+        return read_with_fallback(read)
+    except Exception as e:
+        logger.error(f"Error reading cached answer: {str(e)}")
+        return None
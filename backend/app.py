@@ -1,33 +1,73 @@
 print("1. Starting app.py")
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import anthropic
 import os
+import hmac
+import hashlib
 import logging
+import logging.handlers
+import queue
 from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
 import json
+import uuid
+import atexit
 import stripe
 
 print("2. Basic imports done")
 
-from database import init_db, get_db_connection
+from database import (
+    init_db, get_db_connection, pooled_connection, read_with_fallback,
+    PoolExhausted, ReplicaUnavailable, begin_request, note_write, request_write_time
+)
+import data_access
+from model_router import classify_query, get_route, needs_escalation, ESCALATION_ROUTE
+from llm import call_model, get_tokens_used
+from resilience import (
+    Deadline, DeadlineExceeded, CircuitOpenError, call_upstream,
+    is_retryable_anthropic_error, is_retryable_stripe_error
+)
+from scheduler import scheduler, AdmissionRejected, DEFAULT_TIER
+from answer_cache import store_answer, get_cached_answer
+from background import defer_write
+from exports import EXPORT_TABLES, EXPORT_FORMATS, export_rows
+from archive import load_archived_messages, promote_session, search_text as archive_search_text
+from faq import get_faq_answer
+from profiling import span, start_request, finish_request, should_sample, start_profile, stop_profile
+from statutes import (
+    find_sections, is_citation_lookup, lookup_citation, wants_summary, serialize_section
+)
 
 print("3. Database import done")
 
 # Configure logging
+# Records go through a queue so file and console writes happen on a listener
+# thread instead of inside request handlers
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [logging.FileHandler("app.log"), logging.StreamHandler()]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that reports serialization time as the 'serialize' span"""
+    def dumps(self, obj, **kwargs):
+        with span('serialize'):
+            return super().dumps(obj, **kwargs)
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 
 # Configure CORS
 CORS(app, resources={
@@ -39,8 +79,8 @@ CORS(app, resources={
             "http://localhost:5173",  # Keep for local dev
         ],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Range", "X-Content-Range"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Admin-Key", "X-Profile", "If-None-Match", "X-Last-Write"],
+        "expose_headers": ["Content-Range", "X-Content-Range", "Server-Timing", "ETag", "X-Last-Write"],
         "supports_credentials": True,
         "max_age": 600
     }
@@ -54,6 +94,37 @@ app.config['STRIPE_SECRET_KEY'] = os.getenv('STRIPE_SECRET_KEY')
 if app.config['STRIPE_SECRET_KEY']:
     stripe.api_key = app.config['STRIPE_SECRET_KEY']
 
+# Shared secret for admin-only endpoints (exports)
+app.config['ADMIN_API_KEY'] = os.getenv('ADMIN_API_KEY')
+
+# Query limits per subscription tier
+TIER_LIMITS = {
+    'free': {'daily': 2, 'monthly': 6},
+    'paid': {'daily': 50, 'monthly': 500}
+}
+
+# Usage rows are written in the background only while the user has more than this
+# many queries left; closer to the limit they are written before responding so
+# check_usage_limit always sees them
+app.config['USAGE_SYNC_HEADROOM'] = int(os.getenv('USAGE_SYNC_HEADROOM', 2))
+
+# Cap on sections returned by a single citation lookup (e.g. "Chapter 94 definitions")
+MAX_CITATION_SECTIONS = 5
+
+# Upstream time budgets (seconds)
+app.config['QUERY_BUDGET_SECONDS'] = float(os.getenv('QUERY_BUDGET_SECONDS', 60))
+app.config['STRIPE_BUDGET_SECONDS'] = float(os.getenv('STRIPE_BUDGET_SECONDS', 20))
+app.config['STRIPE_TIMEOUT_SECONDS'] = float(os.getenv('STRIPE_TIMEOUT_SECONDS', 8))
+app.config['STALE_FALLBACK_ENABLED'] = os.getenv('STALE_FALLBACK_ENABLED', 'true').lower() == 'true'
+
+def stripe_client(timeout):
+    """Stripe client for one attempt; its HTTP timeout is what call_upstream leaves of the budget"""
+    # Stripe's module-level API only has a global timeout, so each attempt gets its own client
+    return stripe.StripeClient(
+        app.config['STRIPE_SECRET_KEY'],
+        http_client=stripe.new_default_http_client(timeout=timeout)
+    )
+
 stripe_webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
 stripe_price_id_paid = os.getenv('STRIPE_PRICE_ID_PAID')
 
@@ -62,6 +133,46 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 print("4. About to define routes")
 
+@app.before_request
+def begin_request_timing():
+    start_request()
+    g.profiler = None
+    # Admins can ask for a profile with X-Profile: 1 or ?profile=1; a sampled fraction is profiled anyway
+    asked = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+    if (asked and is_admin_request()) or should_sample():
+        g.profiler = start_profile(f"{request.method} {request.path}")
+
+@app.after_request
+def add_server_timing(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        stop_profile(profiler)
+    response.headers['Server-Timing'] = finish_request()
+    return response
+
+@app.teardown_request
+def stop_unfinished_profile(error=None):
+    # after_request is skipped on unhandled errors; make sure the sampler stops
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        stop_profile(profiler)
+
+@app.before_request
+def begin_write_tracking():
+    # Clients echo the X-Last-Write they were given so any worker keeps their reads on the primary
+    try:
+        client_write_time = float(request.headers.get('X-Last-Write', ''))
+    except ValueError:
+        client_write_time = None
+    begin_request(client_write_time)
+
+@app.after_request
+def add_last_write(response):
+    written = request_write_time()
+    if written is not None:
+        response.headers['X-Last-Write'] = f"{written:.3f}"
+    return response
+
 @app.route('/api/test', methods=['GET'])
 def test_route():
     return jsonify({
@@ -79,72 +190,27 @@ def get_usage():
     if not user_id:
         return jsonify({'error': 'User ID is required'}), 400
     try:
-        # Add debug logging
-        logger.info("About to call get_or_create_user")
-        user = get_or_create_user(user_id)
-        logger.info(f"User created/retrieved: {user}")
+        user, summary, recent_queries = load_usage(user_id)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get today's usage
-        cursor.execute('''
-            SELECT COUNT(*) FROM usage 
-            WHERE user_id = %s AND DATE(created_at) = CURRENT_DATE
-        ''', (user_id,))
-        today_count = cursor.fetchone()[0]
-        
-        # Get monthly usage
-        cursor.execute('''
-            SELECT COUNT(*) FROM usage 
-            WHERE user_id = %s AND DATE_TRUNC('month', created_at) = DATE_TRUNC('month', CURRENT_DATE)
-        ''', (user_id,))
-        month_count = cursor.fetchone()[0]
-        
-        # Get total usage
-        cursor.execute('''
-            SELECT COUNT(*) FROM usage WHERE user_id = %s
-        ''', (user_id,))
-        total_count = cursor.fetchone()[0]
-        
-        # Get recent queries (last 5)
-        cursor.execute('''
-            SELECT query, scope, tokens_used, created_at 
-            FROM usage 
-            WHERE user_id = %s 
-            ORDER BY created_at DESC 
-            LIMIT 5
-        ''', (user_id,))
-        recent_queries = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        # Define limits based on tier
-        limits = {
-            'free': {'daily': 2, 'monthly': 6},
-            'paid': {'daily': 50, 'monthly': 500}
-        }
-        
-        user_limits = limits.get(user['subscription_tier'], limits['free'])
+        user_limits = TIER_LIMITS.get(user['subscription_tier'], TIER_LIMITS['free'])
         
         return jsonify({
             'user_id': user_id,
             'subscription_tier': user['subscription_tier'],
             'subscription_end_date': user['subscription_end_date'],
             'usage': {
-                'daily': today_count,
+                'daily': summary.today if summary else 0,
                 'daily_limit': user_limits['daily'],
-                'monthly': month_count,
+                'monthly': summary.month if summary else 0,
                 'monthly_limit': user_limits['monthly'],
-                'total': total_count
+                'total': summary.total if summary else 0
             },
             'recent_queries': [
                 {
-                    'query': row[0],
-                    'scope': row[1],
-                    'tokens_used': row[2],
-                    'created_at': row[3].isoformat() if row[3] else ''
+                    'query': row.query,
+                    'scope': row.scope,
+                    'tokens_used': row.tokens_used,
+                    'created_at': row.created_at.isoformat() if row.created_at else ''
                 }
                 for row in recent_queries
             ]
@@ -158,6 +224,31 @@ def get_usage():
 
 print("6. Usage route defined")
 
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    # Profile, tier limits, usage, recent queries and the first history page in one request
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+    try:
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'per_page must be an integer'}), 400
+    
+    try:
+        payload, etag = load_bootstrap(user_id, per_page, request.if_none_match)
+        response = jsonify(payload) if payload is not None else Response(status=304)
+        response.set_etag(etag)
+        # The client keeps the body but revalidates it on every load
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in get_bootstrap: {str(e)}")
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+print("6a. Bootstrap route defined")
+
 @app.route('/api/create-checkout-session', methods=['POST'])
 def create_checkout_session():
     try:
@@ -193,12 +284,26 @@ def create_checkout_session():
             
         email, stripe_customer_id = user_data
         
+        deadline = Deadline(app.config['STRIPE_BUDGET_SECONDS'])
+        
         # Create or get Stripe customer
         if not stripe_customer_id:
-            customer = stripe.Customer.create(
-                email=email,
-                metadata={'user_id': user_id}
-            )
+            # Same idempotency key across retries so a retry can't create a second customer
+            customer_key = str(uuid.uuid4())
+            with span('stripe'):
+                customer = call_upstream(
+                    'stripe',
+                    lambda timeout: stripe_client(timeout).customers.create(
+                        params={
+                            'email': email,
+                            'metadata': {'user_id': user_id}
+                        },
+                        options={'idempotency_key': customer_key}
+                    ),
+                    deadline,
+                    is_retryable_stripe_error,
+                    timeout_cap=app.config['STRIPE_TIMEOUT_SECONDS']
+                )
             
             # Save customer ID to database
             cursor.execute('''
@@ -211,24 +316,43 @@ def create_checkout_session():
         conn.close()
         
         # Create checkout session
-        checkout_session = stripe.checkout.Session.create(
-            customer=stripe_customer_id,
-            payment_method_types=['card'],
-            line_items=[{
-                'price': price_id,
-                'quantity': 1,
-            }],
-            mode='subscription',
-            success_url=f'https://wmhelper.com/success?session_id={{CHECKOUT_SESSION_ID}}',
-            cancel_url='https://wmhelper.com/cancel',
-            client_reference_id=user_id,
-            metadata={'user_id': user_id, 'tier': tier}
-        )
+        session_key = str(uuid.uuid4())
+        with span('stripe'):
+            checkout_session = call_upstream(
+                'stripe',
+                lambda timeout: stripe_client(timeout).checkout.sessions.create(
+                    params={
+                        'customer': stripe_customer_id,
+                        'payment_method_types': ['card'],
+                        'line_items': [{
+                            'price': price_id,
+                            'quantity': 1,
+                        }],
+                        'mode': 'subscription',
+                        'success_url': f'https://wmhelper.com/success?session_id={{CHECKOUT_SESSION_ID}}',
+                        'cancel_url': 'https://wmhelper.com/cancel',
+                        'client_reference_id': user_id,
+                        'metadata': {'user_id': user_id, 'tier': tier}
+                    },
+                    options={'idempotency_key': session_key}
+                ),
+                deadline,
+                is_retryable_stripe_error,
+                timeout_cap=app.config['STRIPE_TIMEOUT_SECONDS']
+            )
         
         logger.info(f"Created checkout session for user {user_id}")
         
         return jsonify({'checkoutUrl': checkout_session.url})
         
+    except CircuitOpenError as e:
+        logger.error(f"Checkout session unavailable: {str(e)}")
+        response = jsonify({'error': 'Payments are temporarily unavailable, please try again shortly'})
+        response.headers['Retry-After'] = str(int(e.retry_after))
+        return response, 503
+    except DeadlineExceeded as e:
+        logger.error(f"Checkout session timed out: {str(e)}")
+        return jsonify({'error': 'Payment provider timed out, please try again'}), 504
     except Exception as e:
         logger.error(f"Checkout session error: {str(e)}")
         return jsonify({
@@ -245,27 +369,21 @@ def get_chat_history():
         return jsonify({'error': 'User ID is required'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, title, created_at, updated_at 
-            FROM chat_sessions 
-            WHERE user_id = %s 
-            ORDER BY updated_at DESC
-        ''', (user_id,))
+        def read(conn):
+            cursor = conn.cursor()
+            sessions = data_access.get_sessions(cursor, user_id)
+            cursor.close()
+            return sessions
         
-        sessions = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        sessions = read_with_fallback(read)
         
         return jsonify({
             'sessions': [
                 {
-                    'id': row[0],
-                    'title': row[1],
-                    'created_at': row[2].isoformat() if row[2] else '',
-                    'updated_at': row[3].isoformat() if row[3] else ''
+                    'id': row.id,
+                    'title': row.title,
+                    'created_at': row.created_at.isoformat() if row.created_at else '',
+                    'updated_at': row.updated_at.isoformat() if row.updated_at else ''
                 }
                 for row in sessions
             ]
@@ -284,35 +402,26 @@ def get_chat_session(session_id):
         return jsonify({'error': 'User ID is required'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get session info
-        cursor.execute('''
-            SELECT title, created_at 
-            FROM chat_sessions 
-            WHERE id = %s AND user_id = %s
-        ''', (session_id, user_id))
+        def read(conn):
+            cursor = conn.cursor()
+            session = data_access.get_session_header(cursor, session_id, user_id)
+            messages = None
+            if session and session.archived_at:
+                # Old sessions live compressed in the archive table
+                messages = load_archived_messages(cursor, session_id)
+            
+            if session and messages is None:
+                messages = data_access.get_session_messages(cursor, session_id)
+            cursor.close()
+            return session, messages
         
-        session = cursor.fetchone()
+        session, messages = read_with_fallback(read)
         if not session:
             return jsonify({'error': 'Session not found'}), 404
         
-        # Get messages from separate table
-        cursor.execute('''
-            SELECT message, sender, created_at 
-            FROM chat_messages 
-            WHERE session_id = %s 
-            ORDER BY created_at ASC
-        ''', (session_id,))
-        
-        messages = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
         return jsonify({
-            'title': session[0],
-            'created_at': session[1].isoformat() if session[1] else '',
+            'title': session.title,
+            'created_at': session.created_at.isoformat() if session.created_at else '',
             'messages': [
                 {
                     'text': row[0],
@@ -340,39 +449,25 @@ def save_chat_session():
         return jsonify({'error': 'User ID is required'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
         current_time = datetime.now()
-        
-        if session_id:
-            # Update existing session
-            cursor.execute('''
-                UPDATE chat_sessions 
-                SET title = %s, updated_at = %s 
-                WHERE id = %s AND user_id = %s
-            ''', (title, current_time, session_id, user_id))
-        else:
-            # Create new session
-            cursor.execute('''
-                INSERT INTO chat_sessions (user_id, title, created_at, updated_at)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id
-            ''', (user_id, title, current_time, current_time))
-            session_id = cursor.fetchone()[0]
-        
-        # Clear existing messages for this session
-        cursor.execute('DELETE FROM chat_messages WHERE session_id = %s', (session_id,))
-        
-        # Insert new messages into separate table
-        for msg in messages:
-            cursor.execute('''
-                INSERT INTO chat_messages (session_id, message, sender, created_at)
-                VALUES (%s, %s, %s, %s)
-            ''', (session_id, msg.get('text'), msg.get('sender'), current_time))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with pooled_connection(marks_write=True) as conn:
+            cursor = conn.cursor()
+            if session_id:
+                # Update existing session
+                found, archived_at = data_access.update_session(cursor, session_id, user_id, title, current_time)
+                if not found:
+                    cursor.close()
+                    return jsonify({'error': 'Session not found'}), 404
+                if archived_at:
+                    # Writing to an archived session moves it back to the hot tables
+                    promote_session(cursor, session_id)
+            else:
+                # Create new session
+                session_id = data_access.create_session(cursor, user_id, title, current_time)
+            
+            # Replace the session's messages in one batched insert
+            data_access.replace_session_messages(cursor, session_id, messages, current_time)
+            cursor.close()
         
         return jsonify({
             'session_id': session_id,
@@ -386,6 +481,102 @@ def save_chat_session():
 
 print("10. Save chat session route defined")
 
+@app.route('/api/chat-search', methods=['GET'])
+def search_chat_history():
+    user_id = request.args.get('user_id')
+    search_text = (request.args.get('q') or '').strip()
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+    if not search_text:
+        return jsonify({'error': 'Search query is required'}), 400
+    
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    
+    try:
+        def read(conn):
+            cursor = conn.cursor()
+            
+            # Rank title and message hits together, then only build snippets for the requested page
+            cursor.execute('''
+                WITH q AS (
+                    SELECT websearch_to_tsquery('english', %s) AS query
+                ),
+                hits AS (
+                    SELECT s.id AS session_id, s.title, m.message AS body, m.created_at,
+                           ts_rank(m.search_vector, q.query) AS rank, 'message' AS source
+                    FROM chat_messages m
+                    JOIN chat_sessions s ON s.id = m.session_id
+                    CROSS JOIN q
+                    WHERE s.user_id = %s AND m.search_vector @@ q.query
+                    UNION ALL
+                    SELECT s.id, s.title, s.title, s.updated_at,
+                           ts_rank(s.search_vector, q.query) * 2, 'title'
+                    FROM chat_sessions s
+                    CROSS JOIN q
+                    WHERE s.user_id = %s AND s.search_vector @@ q.query
+                    UNION ALL
+                    -- Archived sessions match as a whole; their snippet is built from the blob below
+                    SELECT s.id, s.title, NULL, s.updated_at,
+                           ts_rank(a.search_vector, q.query), 'archive'
+                    FROM chat_session_archive a
+                    JOIN chat_sessions s ON s.id = a.session_id
+                    CROSS JOIN q
+                    WHERE s.user_id = %s AND a.search_vector @@ q.query
+                ),
+                page AS (
+                    SELECT *, COUNT(*) OVER () AS total
+                    FROM hits
+                    ORDER BY rank DESC, created_at DESC
+                    LIMIT %s OFFSET %s
+                )
+                SELECT page.session_id, page.title,
+                       ts_headline('english', coalesce(page.body, ''), q.query,
+                                   'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2'),
+                       page.created_at, page.rank, page.source, page.total
+                FROM page CROSS JOIN q
+                ORDER BY page.rank DESC, page.created_at DESC
+            ''', (search_text, user_id, user_id, user_id, per_page, (page - 1) * per_page))
+            
+            rows = cursor.fetchall()
+            snippets = {
+                row[0]: archived_snippet(cursor, row[0], search_text)
+                for row in rows if row[5] == 'archive'
+            }
+            cursor.close()
+            return rows, snippets
+        
+        rows, snippets = read_with_fallback(read)
+        
+        total = rows[0][6] if rows else 0
+        return jsonify({
+            'query': search_text,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'has_more': page * per_page < total,
+            'results': [
+                {
+                    'session_id': row[0],
+                    'title': row[1],
+                    'snippet': snippets.get(row[0], row[2]) if row[5] == 'archive' else row[2],
+                    'created_at': row[3].isoformat() if row[3] else '',
+                    'rank': float(row[4]),
+                    'source': row[5]
+                }
+                for row in rows
+            ]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error searching chat history: {str(e)}")
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+print("10a. Chat search route defined")
+
 @app.route('/api/query', methods=['POST'])
 def handle_query():
     logger.info("=== QUERY ROUTE CALLED ===")  # Debug log
@@ -393,6 +584,8 @@ def handle_query():
     user_query = data.get('query')
     scope = data.get('scope', 'mass_laws')
     user_id = data.get('user_id')
+    allow_stale = data.get('allow_stale', app.config['STALE_FALLBACK_ENABLED'])
+    deadline = Deadline(app.config['QUERY_BUDGET_SECONDS'])
     
     logger.info(f"Query: {user_query[:50]}... | User: {user_id} | Scope: {scope}")
     
@@ -401,9 +594,30 @@ def handle_query():
     
     try:
         # Check usage limits
-        can_use, limit_message = check_usage_limit(user_id)
+        can_use, limit_message, quota = check_usage_limit(user_id)
         if not can_use:
             return jsonify({'response': limit_message}), 429
+        defer_usage = can_defer_usage(quota)
+        # Never None here: that would skip admission control, and quota is missing
+        # exactly when the usage check failed under load
+        tier = quota['tier'] if quota else DEFAULT_TIER
+        
+        # Direct citation lookups are answered from the section index without a model call
+        if is_citation_lookup(user_query):
+            sections = lookup_citation(user_query)[:MAX_CITATION_SECTIONS]
+            if sections:
+                return citation_response(user_id, user_query, scope, sections, data, deadline, defer_usage, tier)
+        
+        # Frequent questions are precomputed by faq.py for the current corpus
+        faq_answer = get_faq_answer(user_query, scope)
+        if faq_answer:
+            logger.info(f"FAQ answer for user {user_id}")
+            record_usage(user_id, user_query, scope, 0, 'faq', defer=defer_usage)
+            return jsonify({
+                "type": "mass_laws",
+                "response": faq_answer,
+                "source": "faq"
+            })
         
         if not app.config['ANTHROPIC_API_KEY']:
             return jsonify({'error': 'Anthropic API key not configured'}), 500
@@ -412,7 +626,7 @@ def handle_query():
         file_path = os.path.join(os.path.dirname(__file__), 'data', 'mass_weights_measures_laws.txt')
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
+            with span('corpus'), open(file_path, 'r', encoding='utf-8') as file:
                 laws_text = file.read()
                 logger.info(f"Loaded laws file: {len(laws_text)} characters")
         except FileNotFoundError:
@@ -421,39 +635,60 @@ def handle_query():
             
         # Create Anthropic client
         logger.info("Creating Anthropic client...")
-        client = anthropic.Anthropic(api_key=app.config['ANTHROPIC_API_KEY'])
+        # Retries are handled by call_upstream so they share the request deadline
+        client = anthropic.Anthropic(api_key=app.config['ANTHROPIC_API_KEY'], max_retries=0)
+        
+        # Pick a model and token budget for this query
+        route = get_route(classify_query(user_query))
+        logger.info(f"Routing query to '{route['name']}' ({route['model']}, max_tokens={route['max_tokens']})")
         
-        # Make the Claude query with prompt caching (upgraded to Sonnet 4)
         logger.info("Making Anthropic API call...")
-        response = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1024,
-            system=[
-                {
-                    "type": "text",
-                    "text": "You are an AI assistant specialized in Massachusetts weights and measures laws. Provide accurate and helpful information based on the given context. Please also assume you are chatting with someone who is a Weights and Measures official.\n"
-                },
-                {
-                    "type": "text", 
-                    "text": laws_text,
-                    "cache_control": {"type": "ephemeral"}
-                }
-            ],
-            messages=[{"role": "user", "content": user_query}]
-        )
+        try:
+            # Waits for an admission slot first; free-tier calls are shed before paid ones
+            response = call_model(client, route, laws_text, user_query, deadline, tier)
+            tokens_used = get_tokens_used(response, user_query)
+            
+            # Retry on the bigger model if the fast answer looks unreliable
+            if needs_escalation(route['name'], response):
+                logger.info(f"Escalating query from '{route['name']}' to '{ESCALATION_ROUTE}'")
+                fast_response = response
+                fast_route = route
+                route = get_route(ESCALATION_ROUTE)
+                route['escalated'] = True
+                try:
+                    response = call_model(client, route, laws_text, user_query, deadline, tier)
+                    tokens_used += get_tokens_used(response, user_query)
+                except (DeadlineExceeded, CircuitOpenError, AdmissionRejected, anthropic.APIError) as e:
+                    if isinstance(e, anthropic.APIError) and not is_retryable_anthropic_error(e):
+                        raise
+                    # The bigger model is out of time or unavailable, keep the fast answer
+                    logger.warning(f"Escalation skipped: {type(e).__name__}: {str(e)}")
+                    response = fast_response
+                    route = fast_route
+        except (DeadlineExceeded, CircuitOpenError, AdmissionRejected, anthropic.APIError) as e:
+            if isinstance(e, anthropic.APIError) and not is_retryable_anthropic_error(e):
+                raise
+            logger.error(f"Anthropic call failed: {type(e).__name__}: {str(e)}")
+            return upstream_failure_response(e, user_id, user_query, scope, allow_stale, defer_usage)
         
         response_text = response.content[0].text
         logger.info(f"Got response: {len(response_text)} characters")
         
         # Record usage
-        tokens_used = response.usage.input_tokens + response.usage.output_tokens if hasattr(response, 'usage') else len(user_query.split()) * 2
-        record_usage(user_id, user_query, scope, tokens_used)
+        route_label = f"{route['name']}+escalated" if route.get('escalated') else route['name']
+        record_usage(user_id, user_query, scope, tokens_used, route_label, defer=defer_usage)
+        store_answer(user_query, scope, response_text)
         
         return jsonify({
             "type": "mass_laws", 
             "response": response_text
         })
         
+    except PoolExhausted as e:
+        logger.error(f"Query rejected, database pool exhausted: {str(e)}")
+        response = jsonify({'error': 'The service is busy, please try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         import traceback
@@ -465,120 +700,333 @@ def handle_query():
 
 print("11. Query route defined")
 
+@app.route('/api/sections/<section_ref>', methods=['GET'])
+def get_section(section_ref):
+    # Accepts "295C" or a chapter-qualified "94-295C"; ?chapter= also narrows the match
+    chapter = request.args.get('chapter')
+    section = section_ref
+    if '-' in section_ref:
+        chapter, section = section_ref.split('-', 1)
+    
+    try:
+        sections = find_sections(section=section, chapter=chapter)
+        if not sections:
+            return jsonify({'error': 'Section not found'}), 404
+        return jsonify({'sections': [serialize_section(entry) for entry in sections]})
+    except Exception as e:
+        logger.error(f"Error looking up section {section_ref}: {str(e)}")
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+print("12. Section lookup route defined")
+
+@app.route('/api/admin/export/<table>', methods=['GET'])
+def export_table(table):
+    if not is_admin_request():
+        return jsonify({'error': 'Admin access required'}), 403
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"Unknown table, expected one of: {', '.join(EXPORT_TABLES)}"}), 400
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    user_id = request.args.get('user_id')
+    
+    logger.info(f"Admin export of {table} as {fmt} (start={start}, end={end}, user_id={user_id})")
+    filename = f"{table}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(export_rows(table, fmt, start, end, user_id)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+print("13. Admin export route defined")
+
+@app.route('/api/admin/scheduler', methods=['GET'])
+def scheduler_stats():
+    if not is_admin_request():
+        return jsonify({'error': 'Admin access required'}), 403
+    return jsonify(scheduler.stats())
+
+print("14. Admin scheduler route defined")
+
 # Helper functions
-def get_or_create_user(user_id, email=None, name=None):
+def is_admin_request():
+    admin_key = app.config['ADMIN_API_KEY']
+    provided = request.headers.get('X-Admin-Key', '')
+    return bool(admin_key) and hmac.compare_digest(provided, admin_key)
+
+def parse_date_arg(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+def archived_snippet(cursor, session_id, search_text):
+    """Highlighted snippet for an archived session, from its decompressed messages"""
+    messages = load_archived_messages(cursor, session_id) or []
+    cursor.execute('''
+        SELECT ts_headline('english', %s, websearch_to_tsquery('english', %s),
+                           'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2')
+    ''', (archive_search_text(messages), search_text))
+    return cursor.fetchone()[0]
+
+def format_section(entry):
+    title = f": {entry['title']}" if entry['title'] else ''
+    return f"Chapter {entry['chapter']}, Section {entry['section']}{title}\n\n{entry['text']}"
+
+def citation_response(user_id, user_query, scope, sections, data, deadline, defer_usage=False, tier=DEFAULT_TIER):
+    """Answer a citation lookup with verbatim section text, plus a short summary if asked"""
+    response_text = '\n\n'.join(format_section(entry) for entry in sections)
+    logger.info(f"Citation fast path for user {user_id}: {[entry['section'] for entry in sections]}")
+    
+    route_label = 'citation'
+    tokens_used = 0
+    summary = None
+    if (data.get('summarize') or wants_summary(user_query)) and app.config['ANTHROPIC_API_KEY']:
+        try:
+            client = anthropic.Anthropic(api_key=app.config['ANTHROPIC_API_KEY'], max_retries=0)
+            route = get_route('fast')
+            summary_response = call_model(
+                client, route, response_text,
+                "Summarize the statute text above in a few sentences for a weights and measures official.",
+                deadline, tier
+            )
+            summary = summary_response.content[0].text
+            tokens_used = get_tokens_used(summary_response, user_query)
+            route_label = 'citation+summary'
+        except Exception as e:
+            # The verbatim text is the answer; the summary is a nice-to-have
+            logger.warning(f"Citation summary skipped: {str(e)}")
+    
+    record_usage(user_id, user_query, scope, tokens_used, route_label, defer=defer_usage)
+    
+    return jsonify({
+        "type": "mass_laws",
+        "response": f"{summary}\n\n{response_text}" if summary else response_text,
+        "summary": summary,
+        "sections": [serialize_section(entry) for entry in sections],
+        "source": "citation"
+    })
+
+def upstream_failure_response(error, user_id, user_query, scope, allow_stale, defer_usage=False):
+    """Serve a labelled stale answer if we have one, otherwise fail fast"""
+    if allow_stale:
+        cached = get_cached_answer(user_query, scope)
+        if cached:
+            response_text, cached_at = cached
+            logger.info(f"Serving stale answer from {cached_at} for user {user_id}")
+            record_usage(user_id, user_query, scope, 0, 'stale', defer=defer_usage)
+            return jsonify({
+                "type": "mass_laws",
+                "response": response_text,
+                "stale": True,
+                "cached_at": cached_at.isoformat() if cached_at else None
+            })
+    
+    if isinstance(error, DeadlineExceeded) or isinstance(error, anthropic.APITimeoutError):
+        return jsonify({'error': 'The AI service timed out, please try again'}), 504
+    
+    if isinstance(error, AdmissionRejected):
+        response = jsonify({'error': 'The AI service is busy, please try again shortly'})
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+    
+    retry_after = int(error.retry_after) if isinstance(error, CircuitOpenError) else 30
+    response = jsonify({'error': 'The AI service is temporarily unavailable, please try again shortly'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
+def load_usage(user_id):
+    """Return (user, usage summary, recent queries), reading from a replica when the user exists"""
+    for readonly in (True, False):
+        try:
+            with pooled_connection(readonly=readonly, marks_write=not readonly) as conn:
+                cursor = conn.cursor()
+                # Replicas can't create users, so a new user takes the primary pass
+                user = get_or_create_user(user_id, cursor=cursor, create=not readonly)
+                if user is not None:
+                    summary = data_access.get_usage_summary(cursor, user_id)
+                    recent_queries = data_access.get_recent_queries(cursor, user_id, 5)
+                cursor.close()
+        except ReplicaUnavailable:
+            # The replica broke mid-read; the primary pass reads it again
+            continue
+        if user is not None:
+            return user, summary, recent_queries
+
+def load_bootstrap(user_id, per_page, if_none_match):
+    """Return (payload, etag); payload is None when the client's copy is still current"""
+    for readonly in (True, False):
+        try:
+            with pooled_connection(readonly=readonly, marks_write=not readonly) as conn:
+                cursor = conn.cursor()
+                if not readonly:
+                    # Replicas can't create users, so a new user takes the primary pass
+                    get_or_create_user(user_id, cursor=cursor)
+                row = None
+                etag = None
+                if if_none_match:
+                    # Revalidation only needs the counters, not the lists
+                    version = data_access.get_bootstrap_version(cursor, user_id)
+                    if version is not None:
+                        etag = bootstrap_etag(user_id, per_page, version)
+                if etag is None or not if_none_match.contains_weak(etag):
+                    row = data_access.get_bootstrap(cursor, user_id, 5, per_page)
+                    etag = bootstrap_etag(user_id, per_page, row) if row else None
+                cursor.close()
+        except ReplicaUnavailable:
+            # The replica broke mid-read; the primary pass reads it again
+            continue
+        if etag is None:
+            continue
+        if readonly:
+            touch_last_login(user_id)
+        return (bootstrap_payload(user_id, row) if row else None), etag
+    raise LookupError(f"User {user_id} could not be loaded")
+
+def bootstrap_etag(user_id, per_page, version):
+    fields = data_access.BootstrapVersion._make(version[:len(data_access.BootstrapVersion._fields)])
+    limits = TIER_LIMITS.get(fields.subscription_tier, TIER_LIMITS['free'])
+    return hashlib.sha256(repr((user_id, per_page, tuple(fields), limits)).encode('utf-8')).hexdigest()[:32]
+
+def bootstrap_payload(user_id, row):
+    user_limits = TIER_LIMITS.get(row.subscription_tier, TIER_LIMITS['free'])
+    return {
+        'user_id': user_id,
+        'email': row.email,
+        'name': row.name,
+        'subscription_tier': row.subscription_tier,
+        'subscription_end_date': row.subscription_end_date.isoformat() if row.subscription_end_date else None,
+        'tier_limits': TIER_LIMITS,
+        'usage': {
+            'daily': row.today,
+            'daily_limit': user_limits['daily'],
+            'monthly': row.month,
+            'monthly_limit': user_limits['monthly'],
+            'total': row.total
+        },
+        # Aggregated to JSON in the query, so timestamps are already ISO strings
+        'recent_queries': row.recent_queries,
+        'sessions': row.sessions,
+        'session_count': row.session_count,
+        'has_more_sessions': row.session_count > len(row.sessions)
+    }
+
+def touch_last_login(user_id):
+    # Nothing reads last_login on the request path, so it is written after the response
+    defer_write('UPDATE users SET last_login = %s WHERE id = %s', (datetime.now(), user_id))
+
+def get_or_create_user(user_id, email=None, name=None, cursor=None, create=True):
+    if cursor is None:
+        try:
+            with pooled_connection(marks_write=True) as conn:
+                cursor = conn.cursor()
+                user = get_or_create_user(user_id, email, name, cursor)
+                cursor.close()
+                return user
+        except Exception as e:
+            logger.error(f"Error in get_or_create_user: {str(e)}")
+            return default_user(user_id)
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Check if user exists
-        cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
         current_time = datetime.now()
-        if not user:
-            # Create new user
-            cursor.execute('''
-                INSERT INTO users (id, email, name, subscription_tier, created_at, last_login) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (user_id, email, name, 'free', current_time, current_time))
-            conn.commit()
-            logger.info(f"Created new user: {user_id}")
+        user = data_access.get_user(cursor, user_id)
+        if user:
+            touch_last_login(user_id)
+        elif not create:
+            return None
         else:
-            # Update last login
-            cursor.execute('''
-                UPDATE users SET last_login = %s WHERE id = %s
-            ''', (current_time, user_id))
-            conn.commit()
-        # Get user subscription tier
-        cursor.execute('''
-            SELECT subscription_tier, subscription_end_date, stripe_customer_id 
-            FROM users WHERE id = %s
-        ''', (user_id,))
-        user_data = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            user = data_access.create_user(cursor, user_id, email, name, current_time)
+            if user:
+                logger.info(f"Created new user: {user_id}")
+            else:
+                # Created by a concurrent request
+                user = data_access.get_user(cursor, user_id)
         return {
             'id': user_id,
-            'subscription_tier': user_data[0] if user_data else 'free',
-            'subscription_end_date': user_data[1].isoformat() if user_data and user_data[1] else None,
-            'stripe_customer_id': user_data[2] if user_data else None
+            'subscription_tier': user.subscription_tier if user else 'free',
+            'subscription_end_date': user.subscription_end_date.isoformat() if user and user.subscription_end_date else None,
+            'stripe_customer_id': user.stripe_customer_id if user else None
         }
     except Exception as e:
         logger.error(f"Error in get_or_create_user: {str(e)}")
-        return {
-            'id': user_id,
-            'subscription_tier': 'free',
-            'subscription_end_date': None,
-            'stripe_customer_id': None
-        }
+        raise
+
+def default_user(user_id):
+    return {
+        'id': user_id,
+        'subscription_tier': 'free',
+        'subscription_end_date': None,
+        'stripe_customer_id': None
+    }
 
 def check_usage_limit(user_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Get user subscription tier
-        cursor.execute('''
-            SELECT subscription_tier, subscription_end_date 
-            FROM users WHERE id = %s
-        ''', (user_id,))
-        user_data = cursor.fetchone()
-        if not user_data:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            # Tier and usage counts in one round trip
+            summary = data_access.get_usage_summary(cursor, user_id)
+            if not summary:
+                cursor.close()
+                return False, "User not found", None
+            tier = summary.subscription_tier
+            # Check if subscription has expired
+            if tier != 'free' and summary.subscription_end_date:
+                if datetime.now() > summary.subscription_end_date:
+                    # Downgrade to free if subscription expired
+                    data_access.downgrade_user(cursor, user_id)
+                    tier = 'free'
             cursor.close()
-            conn.close()
-            return False, "User not found"
-        tier, end_date = user_data
-        # Check if subscription has expired
-        if tier != 'free' and end_date:
-            if datetime.now() > end_date:
-                # Downgrade to free if subscription expired
-                cursor.execute('''
-                    UPDATE users SET subscription_tier = 'free' WHERE id = %s
-                ''', (user_id,))
-                conn.commit()
-                tier = 'free'
-        # Get today's usage
-        cursor.execute('''
-            SELECT COUNT(*) FROM usage 
-            WHERE user_id = %s AND DATE(created_at) = CURRENT_DATE
-        ''', (user_id,))
-        today_count = cursor.fetchone()[0]
-        # Get monthly usage
-        cursor.execute('''
-            SELECT COUNT(*) FROM usage 
-            WHERE user_id = %s AND DATE_TRUNC('month', created_at) = DATE_TRUNC('month', CURRENT_DATE)
-        ''', (user_id,))
-        month_count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
-        # Define limits based on tier
-        limits = {
-            'free': {'daily': 2, 'monthly': 6},
-            'paid': {'daily': 50, 'monthly': 500}
-        }
+        today_count, month_count = summary.today, summary.month
         # Check limits
+        limits = TIER_LIMITS
+        remaining = None
         if tier in limits:
             if today_count >= limits[tier]['daily']:
-                return False, f"Daily limit reached for {tier} tier ({limits[tier]['daily']} queries per day)"
+                return False, f"Daily limit reached for {tier} tier ({limits[tier]['daily']} queries per day)", None
             if month_count >= limits[tier]['monthly']:
-                return False, f"Monthly limit reached for {tier} tier ({limits[tier]['monthly']} queries per month)"
-        return True, None
+                return False, f"Monthly limit reached for {tier} tier ({limits[tier]['monthly']} queries per month)", None
+            remaining = min(limits[tier]['daily'] - today_count, limits[tier]['monthly'] - month_count)
+        return True, None, {'tier': tier, 'remaining': remaining}
+    except PoolExhausted:
+        # Overload, not a broken database: failing open here would hand out unmetered queries
+        raise
     except Exception as e:
         logger.error(f"Error checking usage limit: {str(e)}")
-        return True, None  # Allow usage if error
+        return True, None, None  # Allow usage if error
+
+def can_defer_usage(quota):
+    """Usage rows count toward quota, so only defer them when the user has headroom"""
+    if not quota or quota['remaining'] is None:
+        return False
+    return quota['remaining'] > app.config['USAGE_SYNC_HEADROOM']
+
+RECORD_USAGE_SQL = '''
+    INSERT INTO usage (user_id, query, scope, tokens_used, model_route, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+'''
 
-def record_usage(user_id, query, scope, tokens_used):
+def record_usage(user_id, query, scope, tokens_used, model_route=None, defer=False):
+    params = (user_id, query, scope, tokens_used, model_route, datetime.now())
+    if defer:
+        defer_write(RECORD_USAGE_SQL, params)
+        note_write()
+        logger.info(f"Queued usage for user {user_id}: {tokens_used} tokens ({model_route})")
+        return
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO usage (user_id, query, scope, tokens_used, created_at)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (user_id, query, scope, tokens_used, datetime.now()))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logger.info(f"Recorded usage for user {user_id}: {tokens_used} tokens")
+        with pooled_connection(marks_write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(RECORD_USAGE_SQL, params)
+            cursor.close()
+        logger.info(f"Recorded usage for user {user_id}: {tokens_used} tokens ({model_route})")
     except Exception as e:
-        logger.error(f"Error recording usage: {str(e)}")
+        # Hand the row to the background writer rather than lose a metered query
+        logger.error(f"Error recording usage, queueing it instead: {str(e)}")
+        defer_write(RECORD_USAGE_SQL, params)
 
 # Initialize database when app starts
 init_db()
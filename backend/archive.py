@@ -0,0 +1,162 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv('CHAT_ARCHIVE_BATCH_SIZE', 200))
+
+
+def compress_messages(rows):
+    """Pack (message, sender, created_at) rows into one compressed blob"""
+    payload = [
+        [message, sender, created_at.isoformat() if created_at else None]
+        for message, sender, created_at in rows
+    ]
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decompress_messages(blob):
+    """Inverse of compress_messages: returns a list of (message, sender, created_at)"""
+    payload = json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+    return [
+        (message, sender, datetime.fromisoformat(created_at) if created_at else None)
+        for message, sender, created_at in payload
+    ]
+
+
+def search_text(rows):
+    """Message bodies joined for the archive's search vector"""
+    return '\n'.join(message or '' for message, _, _ in rows)
+
+
+def archive_stale_sessions(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move messages of sessions untouched for `days` into chat_session_archive.
+
+    The chat_sessions row stays (so history listings and title search still work)
+    and is marked with archived_at; its messages leave the hot chat_messages table
+    but keep a search vector in the archive row, so chat search still finds them.
+    Runs in batches, committing after each, and returns the number archived.
+    """
+    backfill_search_vectors(batch_size)
+    cutoff = datetime.now() - timedelta(days=days)
+    total = 0
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('''
+                SELECT id FROM chat_sessions
+                WHERE archived_at IS NULL AND updated_at < %s
+                ORDER BY updated_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (cutoff, batch_size))
+            session_ids = [row[0] for row in cursor.fetchall()]
+            if not session_ids:
+                break
+
+            cursor.execute('''
+                SELECT session_id, message, sender, created_at
+                FROM chat_messages
+                WHERE session_id = ANY(%s)
+                ORDER BY session_id, created_at, id
+            ''', (session_ids,))
+            messages = {session_id: [] for session_id in session_ids}
+            for session_id, message, sender, created_at in cursor.fetchall():
+                messages[session_id].append((message, sender, created_at))
+
+            now = datetime.now()
+            for session_id, rows in messages.items():
+                cursor.execute('''
+                    INSERT INTO chat_session_archive (session_id, messages, message_count, archived_at, search_vector)
+                    VALUES (%s, %s, %s, %s, to_tsvector('english', %s))
+                    ON CONFLICT (session_id) DO UPDATE
+                    SET messages = EXCLUDED.messages,
+                        message_count = EXCLUDED.message_count,
+                        archived_at = EXCLUDED.archived_at,
+                        search_vector = EXCLUDED.search_vector
+                ''', (session_id, compress_messages(rows), len(rows), now, search_text(rows)))
+
+            cursor.execute('DELETE FROM chat_messages WHERE session_id = ANY(%s)', (session_ids,))
+            cursor.execute('UPDATE chat_sessions SET archived_at = %s WHERE id = ANY(%s)', (now, session_ids))
+            conn.commit()
+
+            total += len(session_ids)
+            logger.info(f"Archived {len(session_ids)} chat sessions ({total} so far)")
+        cursor.close()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error archiving chat sessions: {str(e)}")
+        raise
+    finally:
+        conn.close()
+    return total
+
+
+def backfill_search_vectors(batch_size=ARCHIVE_BATCH_SIZE):
+    """Index archive rows written before they carried a search vector"""
+    total = 0
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('''
+                SELECT session_id, messages FROM chat_session_archive
+                WHERE search_vector IS NULL
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for session_id, blob in rows:
+                cursor.execute('''
+                    UPDATE chat_session_archive SET search_vector = to_tsvector('english', %s)
+                    WHERE session_id = %s
+                ''', (search_text(decompress_messages(blob)), session_id))
+            conn.commit()
+            total += len(rows)
+        cursor.close()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error indexing archived sessions: {str(e)}")
+        raise
+    finally:
+        conn.close()
+    if total:
+        logger.info(f"Indexed {total} archived chat sessions for search")
+    return total
+
+
+def load_archived_messages(cursor, session_id):
+    """Rehydrate an archived session's messages, or None if it isn't archived"""
+    cursor.execute('SELECT messages FROM chat_session_archive WHERE session_id = %s', (session_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return decompress_messages(row[0])
+
+
+def promote_session(cursor, session_id):
+    """Bring a session back to the hot tables; the caller rewrites its messages"""
+    cursor.execute('DELETE FROM chat_session_archive WHERE session_id = %s', (session_id,))
+    cursor.execute('UPDATE chat_sessions SET archived_at = NULL WHERE id = %s', (session_id,))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Archive chat sessions untouched for N days')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    archived = archive_stale_sessions(args.days, args.batch_size)
+    print(f"Archived {archived} chat sessions")
@@ -0,0 +1,357 @@
+import os
+import json
+import glob
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import Counter
+from datetime import date, datetime
+
+import psycopg2.extras
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.getenv('BACKGROUND_BATCH_SIZE', 200))
+FLUSH_INTERVAL = float(os.getenv('BACKGROUND_FLUSH_INTERVAL', 1.0))
+DRAIN_TIMEOUT = float(os.getenv('BACKGROUND_DRAIN_TIMEOUT', 10))
+# Directory for the crash journal; unset disables the durable spill
+SPILL_DIR = os.getenv('BACKGROUND_SPILL_DIR')
+# Backoff between retries of a failed flush, doubling up to the max
+RETRY_BACKOFF = float(os.getenv('BACKGROUND_RETRY_BACKOFF', 1.0))
+RETRY_MAX_BACKOFF = float(os.getenv('BACKGROUND_RETRY_MAX_BACKOFF', 60))
+# Failed retries before held writes move from memory to the spill directory
+RETRY_ATTEMPTS = int(os.getenv('BACKGROUND_RETRY_ATTEMPTS', 5))
+# How often the writer retries spilled files and journals of dead workers
+REPLAY_INTERVAL = float(os.getenv('BACKGROUND_REPLAY_INTERVAL', 30))
+
+_STOP = object()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BackgroundWriter:
+    """In-process queue of deferred SQL writes, flushed in batches by one thread.
+
+    Writes are grouped by statement and sent with execute_batch in a single
+    transaction per flush. With SPILL_DIR set, every queued write is journalled
+    with a sequence number to a per-process segment file. Committed sequence
+    numbers are appended to the segment as done markers and a segment is deleted
+    once everything in it has committed, so a worker that crashes leaves behind
+    only the writes that never reached the database, and the next worker to
+    start replays just those.
+
+    A flush that fails is held in memory and retried with backoff; newer writes
+    wait in the queue behind it so they commit in order. After RETRY_ATTEMPTS
+    failures the held writes are spilled, and spilled files are retried every
+    REPLAY_INTERVAL. Without SPILL_DIR they stay in memory until the database
+    comes back, and are only given up (and logged) at shutdown.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, spill_dir=SPILL_DIR,
+                 retry_backoff=RETRY_BACKOFF, retry_max_backoff=RETRY_MAX_BACKOFF,
+                 retry_attempts=RETRY_ATTEMPTS, replay_interval=REPLAY_INTERVAL):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.retry_attempts = retry_attempts
+        self.replay_interval = replay_interval
+        # Writes whose flush failed, retried by the writer thread
+        self.failed = []
+        self.failed_lock = threading.Lock()
+        self.attempts = 0
+        self.retry_at = 0.0
+        self.stopping = threading.Event()
+        self.spills = 0
+        self.journal_lock = threading.Lock()
+        self.seq = 0
+        self.segment = 0
+        self.segment_entries = 0
+        # Journalled writes not yet committed (or spilled), per segment
+        self.outstanding = {}
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        # Started lazily so forked workers each get their own thread and journal
+        with self.start_lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self.replay_orphaned_journals(startup=True)
+            self.thread = threading.Thread(target=self.run, name='background-writer', daemon=True)
+            self.thread.start()
+            atexit.register(self.drain)
+
+    def submit(self, sql, params):
+        """Queue a write; runs it inline if the queue is full rather than dropping it"""
+        self.start()
+        with self.journal_lock:
+            task = self.journal(sql, tuple(params)) if self.spill_dir else (sql, tuple(params), None, None)
+            try:
+                self.queue.put_nowait(task)
+                return
+            except queue.Full:
+                pass
+        logger.warning("Background queue full, writing inline")
+        self.write([task])
+
+    def run(self):
+        next_replay = time.monotonic() + self.replay_interval
+        while True:
+            if self.failed:
+                wait = self.retry_at - time.monotonic()
+                if wait > 0 and not self.stopping.is_set():
+                    self.stopping.wait(wait)
+                    continue
+                self.retry_failed()
+                if self.failed:
+                    # Hold queued writes back until the failed ones commit
+                    continue
+            if self.spill_dir and time.monotonic() >= next_replay:
+                self.replay_orphaned_journals()
+                next_replay = time.monotonic() + self.replay_interval
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    task = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if task is _STOP:
+                    stop = True
+                    break
+                batch.append(task)
+            if batch:
+                self.write(batch)
+            if stop:
+                if self.failed:
+                    self.retry_failed()
+                return
+
+    def write(self, batch):
+        """Commit a batch, or hold it for the writer thread to retry"""
+        if self.flush(batch):
+            self.mark_done(batch)
+            return
+        with self.failed_lock:
+            if not self.failed:
+                self.attempts = 0
+                self.retry_at = time.monotonic() + self.retry_backoff
+            self.failed.extend(batch)
+
+    def retry_failed(self):
+        with self.failed_lock:
+            batch, self.failed = self.failed, []
+        if self.flush(batch):
+            logger.info(f"Committed {len(batch)} background writes on retry")
+            self.mark_done(batch)
+            return
+        self.attempts += 1
+        if self.stopping.is_set() or (self.spill_dir and self.attempts >= self.retry_attempts):
+            self.give_up(batch)
+            return
+        with self.failed_lock:
+            self.failed[:0] = batch
+        delay = min(self.retry_backoff * 2 ** self.attempts, self.retry_max_backoff)
+        self.retry_at = time.monotonic() + delay
+        logger.error(f"Holding {len(batch)} failed background writes, retrying in {delay:.0f}s")
+
+    def give_up(self, batch):
+        """Spill writes that keep failing; without a spill directory they are lost"""
+        if self.spill_dir:
+            self.spill(batch)
+        else:
+            statements = Counter(sql.split('(')[0].strip() for sql, _, _, _ in batch)
+            logger.error(f"Lost {len(batch)} background writes at shutdown: {dict(statements)}")
+        self.mark_done(batch)
+
+    def flush(self, batch):
+        """Run a batch in one transaction; True if it committed"""
+        grouped = {}
+        for sql, params, _, _ in batch:
+            grouped.setdefault(sql, []).append(params)
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            for sql, param_list in grouped.items():
+                psycopg2.extras.execute_batch(cursor, sql, param_list)
+            conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.error(f"Background flush of {len(batch)} writes failed: {str(e)}")
+            if conn is not None:
+                conn.rollback()
+            return False
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        """Flush everything queued; called at worker shutdown"""
+        if self.thread is None or not self.thread.is_alive():
+            return
+        # Held writes get one last attempt instead of waiting out their backoff
+        self.stopping.set()
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Background queue still full at shutdown")
+            return
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.error("Background writer did not drain before shutdown timeout")
+        else:
+            logger.info("Background writer drained")
+
+    def segment_path(self, segment):
+        return os.path.join(self.spill_dir, f"pending-{self.pid}-{segment}.jsonl")
+
+    def journal(self, sql, params):
+        """Append a write to the current segment and return its queue task"""
+        # Caller holds journal_lock so journal and queue stay in step
+        self.seq += 1
+        segment = self.segment
+        with open(self.segment_path(segment), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'seq': self.seq, 'sql': sql, 'params': list(params)}, default=_json_default) + '\n')
+        self.outstanding[segment] = self.outstanding.get(segment, 0) + 1
+        self.segment_entries += 1
+        if self.segment_entries >= self.batch_size:
+            self.rotate()
+        return (sql, params, segment, self.seq)
+
+    def rotate(self):
+        self.segment += 1
+        self.segment_entries = 0
+
+    def mark_done(self, batch):
+        """Record committed (or spilled) writes and delete segments with nothing left"""
+        if not self.spill_dir:
+            return
+        done = {}
+        for _, _, segment, seq in batch:
+            if segment is not None:
+                done.setdefault(segment, []).append(seq)
+        with self.journal_lock:
+            for segment, seqs in done.items():
+                self.outstanding[segment] -= len(seqs)
+                path = self.segment_path(segment)
+                if self.outstanding[segment] > 0:
+                    with open(path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps({'done': seqs}) + '\n')
+                    continue
+                del self.outstanding[segment]
+                if segment == self.segment:
+                    # Start a fresh segment rather than append to a fully committed one
+                    self.rotate()
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Could not remove journal segment {path}: {str(e)}")
+
+    def spill(self, batch):
+        self.spills += 1
+        path = os.path.join(self.spill_dir, f"failed-{self.pid}-{int(time.time() * 1000)}-{self.spills}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for sql, params, _, _ in batch:
+                f.write(json.dumps([sql, list(params)], default=_json_default) + '\n')
+        logger.warning(f"Spilled {len(batch)} writes to {path}")
+
+    def replay_orphaned_journals(self, startup=False):
+        """Replay writes left behind by dead workers and failed flushes"""
+        for path in glob.glob(os.path.join(self.spill_dir, '*.jsonl')):
+            name = os.path.basename(path)
+            if name.startswith('pending-'):
+                try:
+                    pid = int(name[len('pending-'):-len('.jsonl')].split('-')[0])
+                except ValueError:
+                    continue
+                # At startup a journal with our own pid is from a previous process that reused it
+                if pid == self.pid and not startup:
+                    continue
+                if pid != self.pid and _pid_alive(pid):
+                    continue
+            elif not name.startswith('failed-'):
+                continue
+            # Renaming claims the file so only one worker replays it
+            claimed = f"{path}.replay-{self.pid}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            if not self.replay(claimed, name):
+                # Database still unavailable; the rest waits for the next interval
+                return
+
+    def replay(self, claimed, name):
+        tasks = read_uncommitted(claimed)
+        if tasks:
+            logger.info(f"Replaying {len(tasks)} background writes from {name}")
+        for i in range(0, len(tasks), self.batch_size):
+            if not self.flush(tasks[i:i + self.batch_size]):
+                # Only the part that did not commit goes back to disk
+                self.spill(tasks[i:])
+                os.remove(claimed)
+                return False
+        os.remove(claimed)
+        return True
+
+
+def read_uncommitted(path):
+    """Tasks in a journal segment or failed-flush file that were never committed"""
+    entries = []
+    done = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave the last line half written
+                logger.warning(f"Skipping unreadable journal line in {path}")
+                continue
+            if isinstance(record, list):
+                # Failed-flush files hold plain [sql, params] pairs, none committed
+                entries.append((None, record[0], record[1]))
+            elif 'done' in record:
+                done.update(record['done'])
+            else:
+                entries.append((record['seq'], record['sql'], record['params']))
+    return [(sql, tuple(params), None, None) for seq, sql, params in entries if seq is None or seq not in done]
+
+
+writer = BackgroundWriter()
+
+
+def defer_write(sql, params):
+    """Run a side-effect write after the response instead of inline"""
+    writer.submit(sql, params)
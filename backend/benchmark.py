@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+from collections import Counter, namedtuple
+
+from statutes import LAWS_FILE, build_section_index, get_corpus_version, section_id
+from model_router import classify_query, get_route
+from llm import SYSTEM_PROMPT, create_message
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), 'data', 'golden_questions.json')
+RECORDINGS_FILE = os.getenv(
+    'BENCHMARK_RECORDINGS_FILE',
+    os.path.join(os.path.dirname(__file__), 'data', 'benchmark_recordings.json')
+)
+
+# Prompt configurations compared by default. route=None lets classify_query pick,
+# as handle_query does; corpus is 'full' (the whole laws file, as shipped today)
+# or 'retrieved' (only the top_k sections ranked against the question).
+CONFIGS = {
+    'production': {'route': None, 'corpus': 'full'},
+    'fast': {'route': 'fast', 'corpus': 'full'},
+    'full': {'route': 'full', 'corpus': 'full'},
+    'fast-256': {'route': 'fast', 'corpus': 'full', 'max_tokens': 256},
+    'retrieved-8': {'route': None, 'corpus': 'retrieved', 'top_k': 8},
+    'retrieved-3': {'route': None, 'corpus': 'retrieved', 'top_k': 3},
+}
+
+# Rough chars-per-token for estimating usage when a model reports none
+CHARS_PER_TOKEN = 4
+
+CITE_RE = re.compile(
+    r'(?:\b(?:chapter|ch\.?|c\.)\s*(\d+[a-z]?)\b[,\s]*)?(?:\bsection|\bsec\.?|§{1,2})\s*(\d+[a-z]*)\b',
+    re.IGNORECASE
+)
+WORD_RE = re.compile(r'[a-z]+')
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'be', 'do', 'does', 'i', 'it', 'of', 'to', 'in', 'on',
+    'for', 'at', 'by', 'and', 'or', 'what', 'how', 'can', 'has', 'have', 'must', 'shall',
+    'any', 'with', 'from', 'that', 'this', 'which', 'who', 'if', 'as', 'not', 'there',
+}
+
+Usage = namedtuple('Usage', ['input_tokens', 'output_tokens'])
+Content = namedtuple('Content', ['text'])
+FakeResponse = namedtuple('FakeResponse', ['content', 'usage', 'stop_reason'])
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def terms(text):
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS and len(word) > 2]
+
+
+def load_golden(path=GOLDEN_FILE):
+    """Load the golden question set, warning about citations missing from the corpus"""
+    with open(path, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    with open(LAWS_FILE, 'r', encoding='utf-8') as f:
+        known = {section_id(entry) for entry in build_section_index(f.read()).values()}
+    for question in golden['questions']:
+        for expected in question['expected']:
+            if expected not in known:
+                logger.warning(f"Golden question {question['id']} expects unknown section {expected}")
+    return golden
+
+
+def extract_citations(text):
+    """Return {(chapter or None, section)} for every section an answer cites"""
+    return {
+        (chapter.upper() if chapter else None, section.upper())
+        for chapter, section in CITE_RE.findall(text or '')
+    }
+
+
+def citation_recall(expected, cited):
+    """Fraction of expected sections cited; a bare "Section 29A" counts for any chapter"""
+    if not expected:
+        return 1.0
+    hits = 0
+    for ref in expected:
+        chapter, section = ref.split('-', 1)
+        if (chapter, section) in cited or (None, section) in cited:
+            hits += 1
+    return hits / len(expected)
+
+
+class SectionRanker:
+    """TF-IDF ranking of corpus sections against a question"""
+
+    def __init__(self, index):
+        self.entries = list(index.values())
+        self.term_counts = [
+            Counter(terms(f"{entry['title'] or ''} {entry['heading'] or ''} {entry['text']}"))
+            for entry in self.entries
+        ]
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        total = len(self.entries)
+        self.idf = {term: math.log(total / count) + 1 for term, count in document_frequency.items()}
+
+    def rank(self, query, top_k):
+        query_terms = set(terms(query))
+        scored = []
+        for entry, counts in zip(self.entries, self.term_counts):
+            score = sum(self.idf[term] * (1 + math.log(counts[term])) for term in query_terms if term in counts)
+            if score:
+                scored.append((score, entry))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+
+def format_corpus(entries):
+    """Render sections in the laws file layout so they parse back into the same index"""
+    blocks = []
+    chapter = None
+    for entry in sorted(entries, key=lambda entry: (entry['chapter'], entry['section'])):
+        if entry['chapter'] != chapter:
+            chapter = entry['chapter']
+            blocks.append(f"CHAPTER {chapter}")
+        blocks.append(entry['text'])
+    return '\n\n'.join(blocks)
+
+
+class FakeModel:
+    """Deterministic local stand-in for the model, for token and truncation numbers only.
+
+    Answers by quoting the prompt sections that best match the question, cut off at
+    max_tokens. It picks them with the same ranker the retrieved-k configurations
+    use to build their corpus, so its citations say nothing about quality; runs
+    with this model report prompt coverage instead of citation recall.
+    """
+
+    name = 'fake'
+    # Citation recall from this model would be circular, see above
+    measures_recall = False
+
+    def __init__(self, max_citations=3):
+        self.max_citations = max_citations
+        self.rankers = {}
+
+    def ranker_for(self, corpus_text):
+        key = hashlib.sha256(corpus_text.encode('utf-8')).hexdigest()
+        if key not in self.rankers:
+            self.rankers[key] = SectionRanker(build_section_index(corpus_text))
+        return self.rankers[key]
+
+    def answer(self, route, corpus_text, query):
+        ranked = self.ranker_for(corpus_text).rank(query, self.max_citations)
+        if ranked:
+            best = ranked[0][0]
+            parts = []
+            for score, entry in ranked:
+                if score < best * 0.5:
+                    break
+                title = f" ({entry['title']})" if entry['title'] else ''
+                opening = entry['text'].split('\n', 1)[-1][:400]
+                parts.append(f"Under Chapter {entry['chapter']}, Section {entry['section']}{title}: {opening}")
+            text = '\n\n'.join(parts)
+        else:
+            text = "I cannot find a provision that addresses this question."
+
+        stop_reason = 'end_turn'
+        limit = route['max_tokens'] * CHARS_PER_TOKEN
+        if len(text) > limit:
+            text = text[:limit]
+            stop_reason = 'max_tokens'
+        usage = Usage(estimate_tokens(SYSTEM_PROMPT + corpus_text + query), estimate_tokens(text))
+        return FakeResponse([Content(text)], usage, stop_reason), None
+
+
+class RecordedModel:
+    """Replays answers recorded from the real API, keyed by the exact prompt.
+
+    Any change to model, max_tokens, system prompt or corpus changes the key, so a
+    new prompt configuration shows up as missing until it is recorded. With
+    record=True, missing answers are fetched from the API and saved.
+    """
+
+    measures_recall = True
+
+    def __init__(self, path=RECORDINGS_FILE, record=False):
+        self.path = path
+        self.record = record
+        self.name = 'record' if record else 'replay'
+        self.recordings = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.recordings = json.load(f)
+        self.client = None
+        if record:
+            import anthropic
+            self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), max_retries=2)
+
+    @staticmethod
+    def prompt_key(route, corpus_text, query):
+        prompt = json.dumps([route['model'], route['max_tokens'], SYSTEM_PROMPT, corpus_text, query])
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def answer(self, route, corpus_text, query):
+        key = self.prompt_key(route, corpus_text, query)
+        recording = self.recordings.get(key)
+        if recording is None and self.record:
+            start = time.perf_counter()
+            response = create_message(self.client, route, corpus_text, query, 120)
+            recording = {
+                'model': route['model'],
+                'query': query,
+                'text': response.content[0].text,
+                'input_tokens': response.usage.input_tokens,
+                'output_tokens': response.usage.output_tokens,
+                'stop_reason': response.stop_reason,
+                'latency_ms': (time.perf_counter() - start) * 1000,
+            }
+            self.recordings[key] = recording
+            self.save()
+        if recording is None:
+            return None, None
+        response = FakeResponse(
+            [Content(recording['text'])],
+            Usage(recording['input_tokens'], recording['output_tokens']),
+            recording['stop_reason']
+        )
+        return response, recording['latency_ms']
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.recordings, f, indent=1)
+
+
+def prompt_coverage(expected, corpus_text, laws_text):
+    """Fraction of expected sections whose text is in the prompt corpus.
+
+    Parses the corpus with the section index rather than asking any ranker, so it
+    is an independent check of what the model could possibly cite.
+    """
+    if not expected:
+        return 1.0
+    if corpus_text is laws_text:
+        return 1.0
+    present = {section_id(entry) for entry in build_section_index(corpus_text).values()}
+    return sum(1 for ref in expected if ref in present) / len(expected)
+
+
+def run_config(name, config, golden, model, laws_text, ranker):
+    """Run every golden question through one prompt configuration"""
+    results = []
+    for question in golden['questions']:
+        query = question['question']
+        start = time.perf_counter()
+        route = get_route(config['route'] or classify_query(query))
+        if 'max_tokens' in config:
+            route['max_tokens'] = config['max_tokens']
+        if config['corpus'] == 'retrieved':
+            corpus_text = format_corpus([entry for _, entry in ranker.rank(query, config['top_k'])])
+        else:
+            corpus_text = laws_text
+        response, recorded_latency = model.answer(route, corpus_text, query)
+        latency_ms = recorded_latency if recorded_latency is not None else (time.perf_counter() - start) * 1000
+        coverage = prompt_coverage(question['expected'], corpus_text, laws_text)
+
+        if response is None:
+            results.append({'id': question['id'], 'coverage': coverage, 'missing': True})
+            continue
+        if model.measures_recall:
+            cited = extract_citations(response.content[0].text)
+            recall = citation_recall(question['expected'], cited)
+            missed = [ref for ref in question['expected'] if citation_recall([ref], cited) == 0]
+        else:
+            recall = None
+            missed = []
+        results.append({
+            'id': question['id'],
+            'route': route['name'],
+            'coverage': coverage,
+            'recall': recall,
+            'missed': missed,
+            'input_tokens': response.usage.input_tokens,
+            'output_tokens': response.usage.output_tokens,
+            'truncated': response.stop_reason == 'max_tokens',
+            'latency_ms': latency_ms,
+            'missing': False,
+        })
+    return {'config': name, 'settings': config, 'results': results, 'summary': summarize(results)}
+
+
+def summarize(results):
+    answered = [result for result in results if not result['missing']]
+    scored = [result for result in answered if result['recall'] is not None]
+    latencies = sorted(result['latency_ms'] for result in answered)
+    count = len(answered) or 1
+    return {
+        'questions': len(results),
+        'missing': len(results) - len(answered),
+        # Expected sections present in the prompt: an upper bound on recall for any model
+        'coverage': sum(result['coverage'] for result in results) / (len(results) or 1),
+        'recall': sum(result['recall'] for result in scored) / len(scored) if scored else None,
+        'fully_cited': sum(1 for result in scored if result['recall'] == 1.0) / len(scored) if scored else None,
+        'truncated': sum(1 for result in answered if result['truncated']),
+        'avg_input_tokens': sum(result['input_tokens'] for result in answered) / count,
+        'avg_output_tokens': sum(result['output_tokens'] for result in answered) / count,
+        'latency_p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+        'latency_p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+    }
+
+
+def run_benchmark(config_names=None, golden_file=GOLDEN_FILE, model=None):
+    golden = load_golden(golden_file)
+    model = model or FakeModel()
+    with open(LAWS_FILE, 'r', encoding='utf-8') as f:
+        laws_text = f.read()
+    ranker = SectionRanker(build_section_index(laws_text))
+    names = config_names or list(CONFIGS)
+    return {
+        'golden_version': golden['version'],
+        'corpus_version': get_corpus_version(),
+        'model': model.name,
+        'runs': [run_config(name, CONFIGS[name], golden, model, laws_text, ranker) for name in names],
+    }
+
+
+def format_report(report, details=False):
+    lines = [
+        f"Golden set v{report['golden_version']} | corpus {report['corpus_version']} | model: {report['model']}",
+        '',
+        f"{'config':<14} {'in prompt':>9} {'recall':>7} {'full':>6} {'in tok':>8} {'out tok':>8} {'trunc':>6} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'missing':>8}",
+    ]
+    for run in report['runs']:
+        summary = run['summary']
+        recall = f"{summary['recall']:>7.2f}" if summary['recall'] is not None else f"{'-':>7}"
+        fully_cited = f"{summary['fully_cited']:>6.0%}" if summary['fully_cited'] is not None else f"{'-':>6}"
+        lines.append(
+            f"{run['config']:<14} {summary['coverage']:>9.2f} {recall} {fully_cited} "
+            f"{summary['avg_input_tokens']:>8.0f} {summary['avg_output_tokens']:>8.0f} {summary['truncated']:>6} "
+            f"{summary['latency_p50_ms']:>9.1f} {summary['latency_p95_ms']:>9.1f} {summary['missing']:>8}"
+        )
+    if report['model'] == 'fake':
+        lines.append('')
+        lines.append("in prompt = expected sections present in the prompt corpus. Citation recall needs real")
+        lines.append("answers: run with --model replay (or record) for the quality signal.")
+    if details:
+        for run in report['runs']:
+            uncovered = [result for result in run['results'] if result['coverage'] < 1.0]
+            if uncovered:
+                lines.append('')
+                lines.append(f"{run['config']} prompt is missing expected sections for: "
+                             f"{', '.join(result['id'] for result in uncovered)}")
+            misses = [result for result in run['results'] if not result['missing'] and result['missed']]
+            if misses:
+                lines.append('')
+                lines.append(f"{run['config']} missed citations:")
+                for result in misses:
+                    lines.append(f"  {result['id']}: {', '.join(result['missed'])}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Benchmark citation recall, tokens and latency of prompt configurations')
+    parser.add_argument('--configs', help=f"Comma-separated configurations (default: all of {', '.join(CONFIGS)})")
+    parser.add_argument('--golden', default=GOLDEN_FILE, help='Golden question set')
+    parser.add_argument('--model', choices=['fake', 'replay', 'record'], default='fake',
+                        help='fake: prompt coverage, tokens and truncation only; replay: citation recall from '
+                             'recorded answers; record: call the API for missing answers')
+    parser.add_argument('--recordings', default=RECORDINGS_FILE)
+    parser.add_argument('--json', help='Also write the full report as JSON to this path')
+    parser.add_argument('--details', action='store_true', help='List missed citations per question')
+    args = parser.parse_args()
+
+    names = args.configs.split(',') if args.configs else None
+    unknown = [name for name in names or [] if name not in CONFIGS]
+    if unknown:
+        parser.error(f"Unknown configurations: {', '.join(unknown)}")
+    model = FakeModel() if args.model == 'fake' else RecordedModel(args.recordings, record=args.model == 'record')
+
+    report = run_benchmark(names, args.golden, model)
+    print(format_report(report, args.details))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,238 @@
+import logging
+from collections import namedtuple
+
+import psycopg2.extras
+
+logger = logging.getLogger(__name__)
+
+# Lightweight row types; cursors return plain tuples that map straight onto these
+User = namedtuple('User', ['subscription_tier', 'subscription_end_date', 'stripe_customer_id'])
+UsageSummary = namedtuple('UsageSummary', ['subscription_tier', 'subscription_end_date', 'today', 'month', 'total'])
+RecentQuery = namedtuple('RecentQuery', ['query', 'scope', 'tokens_used', 'created_at'])
+SessionSummary = namedtuple('SessionSummary', ['id', 'title', 'created_at', 'updated_at'])
+SessionHeader = namedtuple('SessionHeader', ['title', 'created_at', 'archived_at'])
+Message = namedtuple('Message', ['message', 'sender', 'created_at'])
+# Everything that changes what /api/bootstrap returns; hashed into its ETag
+BootstrapVersion = namedtuple('BootstrapVersion', [
+    'subscription_tier', 'subscription_end_date', 'today', 'month', 'total',
+    'last_used', 'session_count', 'last_updated', 'email', 'name'
+])
+Bootstrap = namedtuple('Bootstrap', BootstrapVersion._fields + ('recent_queries', 'sessions'))
+
+# Hot statements, prepared once per pooled connection and then run with EXECUTE
+STATEMENTS = {
+    'user_by_id': '''
+        SELECT subscription_tier, subscription_end_date, stripe_customer_id
+        FROM users WHERE id = $1
+    ''',
+    'insert_user': '''
+        INSERT INTO users (id, email, name, subscription_tier, created_at, last_login)
+        VALUES ($1, $2, $3, 'free', $4, $4)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING subscription_tier, subscription_end_date, stripe_customer_id
+    ''',
+    'downgrade_user': '''
+        UPDATE users SET subscription_tier = 'free' WHERE id = $1
+    ''',
+    # Tier plus daily, monthly and total usage in one round trip
+    'usage_summary': '''
+        SELECT u.subscription_tier, u.subscription_end_date,
+               COALESCE(c.today, 0), COALESCE(c.month, 0), COALESCE(c.total, 0)
+        FROM users u
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1) AS today,
+                   COUNT(*) FILTER (WHERE created_at >= DATE_TRUNC('month', CURRENT_DATE)
+                                      AND created_at < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month') AS month,
+                   COUNT(*) AS total
+            FROM usage WHERE user_id = u.id
+        ) c ON TRUE
+        WHERE u.id = $1
+    ''',
+    'bootstrap_version': '''
+        SELECT u.subscription_tier, u.subscription_end_date,
+               COALESCE(c.today, 0), COALESCE(c.month, 0), COALESCE(c.total, 0), c.last_used,
+               s.session_count, s.last_updated,
+               u.email, u.name
+        FROM users u
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1) AS today,
+                   COUNT(*) FILTER (WHERE created_at >= DATE_TRUNC('month', CURRENT_DATE)
+                                      AND created_at < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month') AS month,
+                   COUNT(*) AS total,
+                   MAX(created_at) AS last_used
+            FROM usage WHERE user_id = u.id
+        ) c ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS session_count, MAX(updated_at) AS last_updated
+            FROM chat_sessions WHERE user_id = u.id
+        ) s ON TRUE
+        WHERE u.id = $1
+    ''',
+    # The version columns plus profile, recent queries ($2) and the first page of
+    # sessions ($3), aggregated to JSON so the whole load is one round trip
+    'bootstrap': '''
+        SELECT u.subscription_tier, u.subscription_end_date,
+               COALESCE(c.today, 0), COALESCE(c.month, 0), COALESCE(c.total, 0), c.last_used,
+               s.session_count, s.last_updated,
+               u.email, u.name,
+               COALESCE(r.recent_queries, '[]'::json), COALESCE(p.sessions, '[]'::json)
+        FROM users u
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) FILTER (WHERE created_at >= CURRENT_DATE AND created_at < CURRENT_DATE + 1) AS today,
+                   COUNT(*) FILTER (WHERE created_at >= DATE_TRUNC('month', CURRENT_DATE)
+                                      AND created_at < DATE_TRUNC('month', CURRENT_DATE) + INTERVAL '1 month') AS month,
+                   COUNT(*) AS total,
+                   MAX(created_at) AS last_used
+            FROM usage WHERE user_id = u.id
+        ) c ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS session_count, MAX(updated_at) AS last_updated
+            FROM chat_sessions WHERE user_id = u.id
+        ) s ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'query', q.query, 'scope', q.scope, 'tokens_used', q.tokens_used, 'created_at', q.created_at
+                   ) ORDER BY q.created_at DESC) AS recent_queries
+            FROM (
+                SELECT query, scope, tokens_used, created_at
+                FROM usage WHERE user_id = u.id
+                ORDER BY created_at DESC
+                LIMIT $2
+            ) q
+        ) r ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                       'id', cs.id, 'title', cs.title, 'created_at', cs.created_at, 'updated_at', cs.updated_at
+                   ) ORDER BY cs.updated_at DESC) AS sessions
+            FROM (
+                SELECT id, title, created_at, updated_at
+                FROM chat_sessions WHERE user_id = u.id
+                ORDER BY updated_at DESC
+                LIMIT $3
+            ) cs
+        ) p ON TRUE
+        WHERE u.id = $1
+    ''',
+    'recent_queries': '''
+        SELECT query, scope, tokens_used, created_at
+        FROM usage WHERE user_id = $1
+        ORDER BY created_at DESC
+        LIMIT $2
+    ''',
+    'sessions_for_user': '''
+        SELECT id, title, created_at, updated_at
+        FROM chat_sessions WHERE user_id = $1
+        ORDER BY updated_at DESC
+    ''',
+    'session_header': '''
+        SELECT title, created_at, archived_at
+        FROM chat_sessions WHERE id = $1 AND user_id = $2
+    ''',
+    'session_messages': '''
+        SELECT message, sender, created_at
+        FROM chat_messages WHERE session_id = $1
+        ORDER BY created_at ASC
+    ''',
+    'update_session': '''
+        UPDATE chat_sessions SET title = $1, updated_at = $2
+        WHERE id = $3 AND user_id = $4
+        RETURNING archived_at
+    ''',
+    'insert_session': '''
+        INSERT INTO chat_sessions (user_id, title, created_at, updated_at)
+        VALUES ($1, $2, $3, $3)
+        RETURNING id
+    ''',
+    'delete_session_messages': '''
+        DELETE FROM chat_messages WHERE session_id = $1
+    ''',
+}
+
+
+def execute(cursor, name, params=()):
+    """Run a named statement, preparing it on this connection the first time"""
+    conn = cursor.connection
+    if name not in conn.prepared:
+        cursor.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        conn.prepared.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+def fetch_one(cursor, name, params, row_type):
+    execute(cursor, name, params)
+    row = cursor.fetchone()
+    return row_type._make(row) if row else None
+
+
+def fetch_all(cursor, name, params, row_type):
+    execute(cursor, name, params)
+    return [row_type._make(row) for row in cursor.fetchall()]
+
+
+def get_user(cursor, user_id):
+    return fetch_one(cursor, 'user_by_id', (user_id,), User)
+
+
+def create_user(cursor, user_id, email, name, now):
+    """Insert a new user; returns None if another request created it first"""
+    return fetch_one(cursor, 'insert_user', (user_id, email, name, now), User)
+
+
+def downgrade_user(cursor, user_id):
+    execute(cursor, 'downgrade_user', (user_id,))
+
+
+def get_usage_summary(cursor, user_id):
+    return fetch_one(cursor, 'usage_summary', (user_id,), UsageSummary)
+
+
+def get_bootstrap_version(cursor, user_id):
+    return fetch_one(cursor, 'bootstrap_version', (user_id,), BootstrapVersion)
+
+
+def get_bootstrap(cursor, user_id, recent_limit, sessions_limit):
+    """Profile, usage, recent queries and first session page; None if the user doesn't exist"""
+    return fetch_one(cursor, 'bootstrap', (user_id, recent_limit, sessions_limit), Bootstrap)
+
+
+def get_recent_queries(cursor, user_id, limit=5):
+    return fetch_all(cursor, 'recent_queries', (user_id, limit), RecentQuery)
+
+
+def get_sessions(cursor, user_id):
+    return fetch_all(cursor, 'sessions_for_user', (user_id,), SessionSummary)
+
+
+def get_session_header(cursor, session_id, user_id):
+    return fetch_one(cursor, 'session_header', (session_id, user_id), SessionHeader)
+
+
+def get_session_messages(cursor, session_id):
+    return fetch_all(cursor, 'session_messages', (session_id,), Message)
+
+
+def update_session(cursor, session_id, user_id, title, now):
+    """Returns (found, archived_at)"""
+    execute(cursor, 'update_session', (title, now, session_id, user_id))
+    row = cursor.fetchone()
+    return (True, row[0]) if row else (False, None)
+
+
+def create_session(cursor, user_id, title, now):
+    execute(cursor, 'insert_session', (user_id, title, now))
+    return cursor.fetchone()[0]
+
+
+def replace_session_messages(cursor, session_id, messages, now):
+    """Swap a session's messages; all inserts go in one multi-row statement"""
+    execute(cursor, 'delete_session_messages', (session_id,))
+    if messages:
+        psycopg2.extras.execute_values(
+            cursor,
+            'INSERT INTO chat_messages (session_id, message, sender, created_at) VALUES %s',
+            [(session_id, msg.get('text'), msg.get('sender'), now) for msg in messages],
+            page_size=500
+        )
@@ -1,13 +1,37 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.extensions
+import psycopg2.pool
 import os
+import time
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+from profiling import record_span
+
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """Get database connection"""
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports statement time as the request's 'db' span"""
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_span('db', time.perf_counter() - start)
+
+def get_db_connection(readonly=False):
+    """Get database connection; readonly connections may go to a replica"""
+    if readonly:
+        url = choose_read_url()
+        if url:
+            try:
+                return psycopg2.connect(url, cursor_factory=TimedCursor, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+            except psycopg2.OperationalError as e:
+                logger.warning(f"Replica unavailable, using primary: {str(e)}")
+                mark_replica_down(url)
     try:
         DATABASE_URL = os.getenv('DATABASE_URL')
         
@@ -24,12 +48,258 @@ def get_db_connection():
             logger.error("DATABASE_URL environment variable not set")
             raise ValueError("DATABASE_URL environment variable not set")
         
-        conn = psycopg2.connect(DATABASE_URL)
+        start = time.perf_counter()
+        conn = psycopg2.connect(DATABASE_URL, cursor_factory=TimedCursor)
+        record_span('db_connect', time.perf_counter() - start)
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}")
         raise
 
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers which named statements it has prepared"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class PoolExhausted(psycopg2.pool.PoolError):
+    """Raised when no pooled connection frees up within DB_POOL_TIMEOUT"""
+
+class ReplicaUnavailable(psycopg2.OperationalError):
+    """Raised when a replica connection fails mid-read; the read is safe to retry on the primary"""
+
+class BoundedConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool whose getconn waits for a free connection.
+
+    The stock pool raises PoolError the moment maxconn connections are out;
+    here callers queue on a semaphore for up to `timeout` seconds instead.
+    """
+    def __init__(self, minconn, maxconn, *args, timeout=5.0, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolExhausted(f"No database connection free after {self.timeout:.0f}s")
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+# Optional read replicas, comma separated; reads fall back to the primary when
+# none is healthy and caught up
+REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 10))
+# Seconds to wait when connecting to a replica, so an unreachable one fails fast
+REPLICA_CONNECT_TIMEOUT = int(os.getenv('REPLICA_CONNECT_TIMEOUT', 2))
+# After a client writes, its reads go to the primary for this long. The write time
+# travels with the client (X-Last-Write), so this holds across worker processes
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 10))
+
+_pools = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+# One lock per url, so connecting to a slow replica never blocks the primary's pool
+_pool_create_locks = {}
+
+_replica_state = {}
+_replica_lock = threading.Lock()
+_replica_cursor = 0
+
+# Per-request write tracking, set up by the web layer for each request
+_request = threading.local()
+
+def get_pool(url=None):
+    """Per-process connection pool for the primary (or a replica url), created lazily so forked workers get their own"""
+    global _pools, _pool_create_locks, _pool_pid
+    if url is None:
+        url = os.getenv('DATABASE_URL')
+        if not url:
+            raise ValueError("DATABASE_URL environment variable not set")
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pools = {}
+            _pool_create_locks = {}
+            _pool_pid = os.getpid()
+        if url in _pools:
+            return _pools[url]
+        create_lock = _pool_create_locks.setdefault(url, threading.Lock())
+    # Opening minconn connections can take a connect timeout, so it happens outside _pool_lock
+    with create_lock:
+        with _pool_lock:
+            if url in _pools:
+                return _pools[url]
+        replica = url in REPLICA_URLS
+        pool = BoundedConnectionPool(
+            int(os.getenv('DB_POOL_MIN', 1)),
+            int(os.getenv('DB_POOL_MAX', 10)),
+            url,
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            connection_factory=PooledConnection,
+            cursor_factory=TimedCursor,
+            **({'connect_timeout': REPLICA_CONNECT_TIMEOUT} if replica else {})
+        )
+        with _pool_lock:
+            _pools[url] = pool
+        logger.info(f"Created database connection pool ({'replica' if replica else 'primary'})")
+        return pool
+
+def discard_pool(url):
+    """Drop a replica's pool so its next use opens fresh connections"""
+    with _pool_lock:
+        _pools.pop(url, None)
+
+def begin_request(client_write_time=None):
+    """Start tracking a request; client_write_time is the client's last write (unix seconds)"""
+    _request.client_write_time = client_write_time
+    _request.wrote_at = None
+
+def note_write():
+    """Record that this request wrote data its client may read back"""
+    _request.wrote_at = time.time()
+
+def request_write_time():
+    """Unix time of this request's last write, for the client to send back, or None"""
+    return getattr(_request, 'wrote_at', None)
+
+def wrote_recently():
+    written = max(
+        getattr(_request, 'client_write_time', None) or 0,
+        getattr(_request, 'wrote_at', None) or 0
+    )
+    return time.time() - written < READ_YOUR_WRITES_SECONDS
+
+def check_replica(url):
+    """Measure a replica's replay lag; returns None if it is unreachable"""
+    pool = get_pool(url)
+    conn = pool.getconn()
+    try:
+        cursor = conn.cursor()
+        # An idle primary makes replay timestamps look old, so a fully replayed replica counts as 0 lag
+        cursor.execute('''
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        ''')
+        lag = float(cursor.fetchone()[0])
+        cursor.close()
+        conn.commit()
+        return lag
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def replica_is_usable(url):
+    now = time.monotonic()
+    with _replica_lock:
+        state = _replica_state.get(url)
+        if state and now - state['checked_at'] < REPLICA_CHECK_INTERVAL:
+            return state['usable']
+        # Claim the check so concurrent requests keep using the last result
+        _replica_state[url] = {'usable': state['usable'] if state else False, 'checked_at': now}
+    try:
+        lag = check_replica(url)
+        usable = lag <= REPLICA_MAX_LAG_SECONDS
+        if not usable:
+            logger.warning(f"Replica lagging by {lag:.1f}s, reading from primary")
+    except Exception as e:
+        logger.warning(f"Replica health check failed: {str(e)}")
+        usable = False
+    with _replica_lock:
+        _replica_state[url] = {'usable': usable, 'checked_at': time.monotonic()}
+    return usable
+
+def mark_replica_down(url):
+    with _replica_lock:
+        _replica_state[url] = {'usable': False, 'checked_at': time.monotonic()}
+
+def choose_read_url():
+    """Pick a healthy, caught-up replica round robin, or None for the primary"""
+    global _replica_cursor
+    if not REPLICA_URLS or wrote_recently():
+        return None
+    with _replica_lock:
+        start = _replica_cursor
+        _replica_cursor = (_replica_cursor + 1) % len(REPLICA_URLS)
+    for offset in range(len(REPLICA_URLS)):
+        url = REPLICA_URLS[(start + offset) % len(REPLICA_URLS)]
+        if replica_is_usable(url):
+            return url
+    return None
+
+@contextmanager
+def pooled_connection(readonly=False, marks_write=False):
+    """Borrow a pooled connection; commits on success, rolls back on error.
+    
+    readonly=True may be served by a replica; if the replica connection fails
+    mid-read the replica is marked down and ReplicaUnavailable is raised so the
+    caller can retry on the primary (see read_with_fallback). marks_write=True
+    records the commit as a write the client may read back, pinning its reads
+    to the primary for a short read-your-writes window.
+    """
+    url = choose_read_url() if readonly else None
+    start = time.perf_counter()
+    try:
+        pool = get_pool(url)
+        conn = pool.getconn()
+    except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+        if url is None:
+            raise
+        logger.warning(f"Replica unavailable, reading from primary: {str(e)}")
+        # An exhausted pool says nothing about the replica's health
+        if isinstance(e, psycopg2.OperationalError):
+            mark_replica_down(url)
+        url = None
+        pool = get_pool()
+        conn = pool.getconn()
+    record_span('db_connect', time.perf_counter() - start)
+    try:
+        yield conn
+        conn.commit()
+        if marks_write:
+            note_write()
+    except Exception as e:
+        if not conn.closed:
+            conn.rollback()
+            # Start clean rather than guess which statements survived the failed transaction
+            cursor = conn.cursor()
+            cursor.execute('DEALLOCATE ALL')
+            cursor.close()
+            conn.commit()
+            conn.prepared.clear()
+        if url is not None and isinstance(e, psycopg2.OperationalError):
+            logger.warning(f"Replica failed mid-read, marking it down: {str(e)}")
+            mark_replica_down(url)
+            if conn.closed:
+                # A dropped connection usually means a restart; the pool's other connections are dead too
+                discard_pool(url)
+            raise ReplicaUnavailable(str(e)) from e
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def read_with_fallback(read):
+    """Return read(conn) from a replica-eligible connection, retrying once on the primary if the replica fails"""
+    try:
+        with pooled_connection(readonly=True) as conn:
+            return read(conn)
+    except ReplicaUnavailable:
+        pass
+    with pooled_connection() as conn:
+        return read(conn)
+
 def init_db():
     """Initialize database tables"""
     try:
@@ -81,11 +351,65 @@ def init_db():
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                query_key CHAR(64) PRIMARY KEY,
+                scope VARCHAR(100),
+                query TEXT,
+                response TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_session_archive (
+                session_id INTEGER PRIMARY KEY REFERENCES chat_sessions(id) ON DELETE CASCADE,
+                messages BYTEA NOT NULL,
+                message_count INTEGER,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS faq_answers (
+                query_key CHAR(64) PRIMARY KEY,
+                scope VARCHAR(100),
+                query TEXT,
+                response TEXT,
+                hits INTEGER,
+                corpus_version VARCHAR(64),
+                model VARCHAR(100),
+                tokens_used INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Columns added after the initial schema
+        cursor.execute('ALTER TABLE usage ADD COLUMN IF NOT EXISTS model_route VARCHAR(50)')
+        
+        cursor.execute('ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP')
+        
+        # Full-text search vectors for chat history (generated columns need PostgreSQL 12+)
+        cursor.execute('''
+            ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED
+        ''')
+        cursor.execute('''
+            ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(title, ''))) STORED
+        ''')
+        # Archived message bodies are compressed, so archive.py fills this when it archives
+        cursor.execute('ALTER TABLE chat_session_archive ADD COLUMN IF NOT EXISTS search_vector tsvector')
+        
         # Create indexes
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_usage_user_id ON usage(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_usage_created_at ON usage(created_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON chat_sessions(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_archive_candidates ON chat_sessions(updated_at) WHERE archived_at IS NULL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_search ON chat_messages USING GIN (search_vector)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_search ON chat_sessions USING GIN (search_vector)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_session_archive_search ON chat_session_archive USING GIN (search_vector)')
         
         conn.commit()
         cursor.close()
@@ -118,4 +442,23 @@ def execute_query(query, params=None, fetch=False):
         
     except Exception as e:
         logger.error(f"Database query error: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def stream_query(query, params=None, itersize=2000, readonly=True):
+    """Yield rows from a named server-side cursor so large results never sit in memory"""
+    conn = get_db_connection(readonly=readonly)
+    try:
+        # Named cursors fetch itersize rows per round trip instead of the whole result
+        cursor = conn.cursor(name=f"stream_{os.getpid()}_{id(conn)}")
+        cursor.itersize = itersize
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+        cursor.close()
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Database stream error: {str(e)}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
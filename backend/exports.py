@@ -0,0 +1,136 @@
+import io
+import csv
+import json
+import logging
+from datetime import date, datetime
+
+from database import stream_query
+from archive import decompress_messages
+
+logger = logging.getLogger(__name__)
+
+# Exportable tables: columns, the table's timestamp column, and how to filter by user
+EXPORT_TABLES = {
+    'usage': {
+        'columns': ['id', 'user_id', 'query', 'scope', 'tokens_used', 'model_route', 'created_at'],
+        'from': 'usage t',
+        'user_column': 't.user_id',
+    },
+    'chat_sessions': {
+        'columns': ['id', 'user_id', 'title', 'created_at', 'updated_at'],
+        'from': 'chat_sessions t',
+        'user_column': 't.user_id',
+    },
+    'chat_messages': {
+        'columns': ['id', 'session_id', 'message', 'sender', 'created_at'],
+        'from': 'chat_messages t JOIN chat_sessions s ON s.id = t.session_id',
+        'user_column': 's.user_id',
+        # Messages of archived sessions live compressed in chat_session_archive and
+        # are appended after the hot rows with archived=true and no message id
+        'archived': True,
+    },
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows buffered into each chunk written to the response
+CHUNK_ROWS = 500
+
+
+def build_export_query(table, start=None, end=None, user_id=None):
+    spec = EXPORT_TABLES[table]
+    columns = ', '.join(f"t.{column}" for column in spec['columns'])
+    conditions = []
+    params = []
+    if start:
+        conditions.append('t.created_at >= %s')
+        params.append(start)
+    if end:
+        conditions.append('t.created_at < %s')
+        params.append(end)
+    if user_id:
+        conditions.append(f"{spec['user_column']} = %s")
+        params.append(user_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT {columns} FROM {spec['from']} {where} ORDER BY t.id", params
+
+
+def build_archive_query(start=None, end=None, user_id=None):
+    conditions = []
+    params = []
+    # Coarse session-level filter; messages are filtered exactly after decompression
+    if start:
+        conditions.append('s.updated_at >= %s')
+        params.append(start)
+    if end:
+        conditions.append('s.created_at < %s')
+        params.append(end)
+    if user_id:
+        conditions.append('s.user_id = %s')
+        params.append(user_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f'''
+        SELECT a.session_id, a.messages
+        FROM chat_session_archive a JOIN chat_sessions s ON s.id = a.session_id
+        {where} ORDER BY a.session_id
+    '''
+    return query, params
+
+
+def archived_message_rows(start=None, end=None, user_id=None):
+    """Yield chat_messages-shaped rows (id is None) for archived sessions"""
+    query, params = build_archive_query(start, end, user_id)
+    for session_id, blob in stream_query(query, params):
+        for message, sender, created_at in decompress_messages(blob):
+            if start and (created_at is None or created_at < start):
+                continue
+            if end and (created_at is None or created_at >= end):
+                continue
+            yield (None, session_id, message, sender, created_at)
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(table, fmt, start=None, end=None, user_id=None):
+    """Generate the export body chunk by chunk from a server-side cursor"""
+    spec = EXPORT_TABLES[table]
+    columns = spec['columns'] + (['archived'] if spec.get('archived') else [])
+    query, params = build_export_query(table, start, end, user_id)
+
+    def rows():
+        for row in stream_query(query, params):
+            yield row + ((False,) if spec.get('archived') else ())
+        if spec.get('archived'):
+            for row in archived_message_rows(start, end, user_id):
+                yield row + (True,)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    count = 0
+    for row in rows():
+        values = [_serialize(value) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), default=str))
+            buffer.write('\n')
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+    logger.info(f"Exported {count} rows from {table} as {fmt}")
@@ -0,0 +1,190 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+from database import get_db_connection, read_with_fallback
+from answer_cache import normalize_query, query_key
+from statutes import LAWS_FILE, get_corpus_version
+
+logger = logging.getLogger(__name__)
+
+FAQ_TOP_N = int(os.getenv('FAQ_TOP_N', 50))
+FAQ_LOOKBACK_DAYS = int(os.getenv('FAQ_LOOKBACK_DAYS', 90))
+FAQ_MIN_HITS = int(os.getenv('FAQ_MIN_HITS', 3))
+# Distinct normalized questions pulled from usage before clustering
+FAQ_CANDIDATES = int(os.getenv('FAQ_CANDIDATES', 2000))
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'be', 'do', 'does', 'i', 'we', 'you', 'my',
+    'of', 'to', 'in', 'on', 'for', 'at', 'by', 'and', 'or', 'what', 'whats', 'how',
+    'can', 'please', 'tell', 'me', 'about', 'there', 'it', 'this', 'that',
+}
+
+
+def stem(word):
+    # Plural folding is enough to merge "scale"/"scales" style variants
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def question_tokens(normalized):
+    return frozenset(stem(word) for word in normalized.split() if word not in STOPWORDS)
+
+
+def mine_frequent_questions(cursor, lookback_days=FAQ_LOOKBACK_DAYS, limit=FAQ_CANDIDATES):
+    """Return [(scope, query, count)] for the most asked questions in the lookback window"""
+    since = datetime.now() - timedelta(days=lookback_days)
+    cursor.execute('''
+        SELECT scope, query, COUNT(*) AS hits
+        FROM usage
+        WHERE created_at >= %s AND query IS NOT NULL
+          -- citation lookups never reach the model, so there is nothing to precompute
+          AND (model_route IS NULL OR model_route NOT LIKE 'citation%%')
+        GROUP BY scope, query
+        ORDER BY hits DESC
+        LIMIT %s
+    ''', (since, limit))
+    return cursor.fetchall()
+
+
+def cluster_questions(rows):
+    """Merge wordings with the same content words; most frequent wording represents each cluster.
+
+    Only identical token sets merge. Near matches can differ by exactly the word
+    that changes the legal answer ("not used for retail", "in Boston", "5 pounds"),
+    so they are never treated as the same question.
+    """
+    merged = {}
+    for scope, query, hits in rows:
+        normalized = normalize_query(query)
+        if not normalized:
+            continue
+        entry = merged.setdefault((scope, normalized), {'scope': scope, 'query': query, 'hits': 0})
+        entry['hits'] += hits
+
+    clusters = {}
+    for (scope, normalized), entry in sorted(merged.items(), key=lambda item: item[1]['hits'], reverse=True):
+        tokens = question_tokens(normalized)
+        cluster = clusters.get((scope, tokens))
+        if cluster is None:
+            clusters[(scope, tokens)] = {
+                'scope': scope,
+                'query': entry['query'],
+                'tokens': tokens,
+                'hits': entry['hits'],
+                'variants': [entry['query']],
+            }
+        else:
+            cluster['hits'] += entry['hits']
+            cluster['variants'].append(entry['query'])
+    return sorted(clusters.values(), key=lambda cluster: cluster['hits'], reverse=True)
+
+
+def get_faq_answer(query, scope):
+    """Return a precomputed answer for the question under the current corpus, or None"""
+    try:
+        def read(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT response FROM faq_answers
+                WHERE query_key = %s AND corpus_version = %s
+            ''', (query_key(query, scope), get_corpus_version()))
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+
+        row = read_with_fallback(read)
+        return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Error reading FAQ answer: {str(e)}")
+        return None
+
+
+def precompute_faq(top_n=FAQ_TOP_N, min_hits=FAQ_MIN_HITS, force=False):
+    """Answer the top-N question clusters against the current corpus and store them.
+
+    Clusters already answered for this corpus version are skipped unless force is
+    set, so the job is cheap to re-run and safe to run on every deploy.
+    """
+    import anthropic
+    from llm import call_model, get_tokens_used
+    from model_router import classify_query, get_route, needs_escalation, ESCALATION_ROUTE
+    from resilience import Deadline
+
+    version = get_corpus_version()
+    with open(LAWS_FILE, 'r', encoding='utf-8') as f:
+        laws_text = f.read()
+    client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), max_retries=0)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Answers for an older corpus can never be served again
+        cursor.execute('DELETE FROM faq_answers WHERE corpus_version <> %s', (version,))
+        removed = cursor.rowcount
+        conn.commit()
+        if removed:
+            logger.info(f"Invalidated {removed} FAQ answers from older corpus versions")
+
+        clusters = [cluster for cluster in cluster_questions(mine_frequent_questions(cursor)) if cluster['hits'] >= min_hits]
+        answered = 0
+        for cluster in clusters[:top_n]:
+            keys = [query_key(variant, cluster['scope']) for variant in cluster['variants']]
+            if not force:
+                cursor.execute('''
+                    SELECT COUNT(*) FROM faq_answers WHERE query_key = ANY(%s) AND corpus_version = %s
+                ''', (keys, version))
+                if cursor.fetchone()[0] == len(set(keys)):
+                    continue
+
+            route = get_route(classify_query(cluster['query']))
+            try:
+                response = call_model(client, route, laws_text, cluster['query'], Deadline(120))
+                tokens_used = get_tokens_used(response, cluster['query'])
+                # Same escalation as the live path, so a hedged fast answer is never served to everyone
+                if needs_escalation(route['name'], response):
+                    route = get_route(ESCALATION_ROUTE)
+                    response = call_model(client, route, laws_text, cluster['query'], Deadline(120))
+                    tokens_used += get_tokens_used(response, cluster['query'])
+            except Exception as e:
+                logger.error(f"FAQ answer failed for '{cluster['query'][:50]}': {str(e)}")
+                continue
+            if response.stop_reason == 'max_tokens':
+                logger.warning(f"FAQ answer truncated, not storing: {cluster['query'][:50]}")
+                continue
+            response_text = response.content[0].text
+
+            # Every wording in the cluster points at the same answer
+            now = datetime.now()
+            for variant, key in zip(cluster['variants'], keys):
+                cursor.execute('''
+                    INSERT INTO faq_answers (query_key, scope, query, response, hits, corpus_version, model, tokens_used, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (query_key) DO UPDATE
+                    SET query = EXCLUDED.query, response = EXCLUDED.response, hits = EXCLUDED.hits,
+                        corpus_version = EXCLUDED.corpus_version, model = EXCLUDED.model,
+                        tokens_used = EXCLUDED.tokens_used, created_at = EXCLUDED.created_at
+                ''', (key, cluster['scope'], variant, response_text, cluster['hits'], version,
+                      route['model'], tokens_used, now))
+            conn.commit()
+            answered += 1
+            logger.info(f"Precomputed FAQ answer ({cluster['hits']} hits, {len(keys)} wordings): {cluster['query'][:60]}")
+    finally:
+        cursor.close()
+        conn.close()
+    return answered
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Precompute answers for the most frequent questions')
+    parser.add_argument('--top', type=int, default=FAQ_TOP_N)
+    parser.add_argument('--min-hits', type=int, default=FAQ_MIN_HITS)
+    parser.add_argument('--force', action='store_true', help='Re-answer clusters that are already current')
+    args = parser.parse_args()
+
+    answered = precompute_faq(args.top, args.min_hits, args.force)
+    print(f"Precomputed {answered} FAQ answers for corpus {get_corpus_version()}")
@@ -0,0 +1,57 @@
+import logging
+
+from profiling import span
+from resilience import call_upstream, is_retryable_anthropic_error
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are an AI assistant specialized in Massachusetts weights and measures laws. Provide accurate and helpful information based on the given context. Please also assume you are chatting with someone who is a Weights and Measures official.\n"
+
+
+def call_model(client, route, laws_text, user_query, deadline, tier=None):
+    """Make the Claude query for a route with prompt caching, within the request deadline.
+
+    With a tier the call first waits for an admission slot (see scheduler.py);
+    offline jobs pass no tier and call the API directly.
+    """
+    if tier is None:
+        return _call_model(client, route, laws_text, user_query, deadline)
+    with scheduler.slot(tier, deadline):
+        return _call_model(client, route, laws_text, user_query, deadline)
+
+
+def _call_model(client, route, laws_text, user_query, deadline):
+    with span('llm'):
+        return call_upstream(
+            'anthropic',
+            lambda timeout: create_message(client, route, laws_text, user_query, timeout),
+            deadline,
+            is_retryable_anthropic_error
+        )
+
+
+def create_message(client, route, laws_text, user_query, timeout):
+    return client.messages.create(
+        model=route['model'],
+        max_tokens=route['max_tokens'],
+        system=[
+            {
+                "type": "text",
+                "text": SYSTEM_PROMPT
+            },
+            {
+                "type": "text",
+                "text": laws_text,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ],
+        messages=[{"role": "user", "content": user_query}],
+        timeout=timeout
+    )
+
+
+def get_tokens_used(response, user_query):
+    if hasattr(response, 'usage'):
+        return response.usage.input_tokens + response.usage.output_tokens
+    return len(user_query.split()) * 2
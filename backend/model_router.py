@@ -0,0 +1,85 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Route table: which model and token budget each class of query gets.
+# Model names can be overridden from the environment without a deploy.
+ROUTES = {
+    'fast': {
+        'model': os.getenv('ANTHROPIC_MODEL_FAST', 'claude-3-5-haiku-20241022'),
+        'max_tokens': int(os.getenv('ANTHROPIC_MAX_TOKENS_FAST', 512)),
+    },
+    'full': {
+        'model': os.getenv('ANTHROPIC_MODEL_FULL', 'claude-sonnet-4-20250514'),
+        'max_tokens': int(os.getenv('ANTHROPIC_MAX_TOKENS_FULL', 1024)),
+    },
+    'extended': {
+        'model': os.getenv('ANTHROPIC_MODEL_FULL', 'claude-sonnet-4-20250514'),
+        'max_tokens': int(os.getenv('ANTHROPIC_MAX_TOKENS_EXTENDED', 2048)),
+    },
+}
+
+# Route used when the fast answer looks unreliable
+ESCALATION_ROUTE = 'full'
+
+SECTION_REF_RE = re.compile(r'\b(?:section|sec\.?|§|chapter|ch\.?)\s*\d+[a-z]*\b', re.IGNORECASE)
+
+LOOKUP_KEYWORDS = (
+    'what section', 'which section', 'what chapter', 'which chapter',
+    'define', 'definition', 'what is the fee', 'what is the fine',
+    'what is the penalty', 'where does it say', 'show me', 'what does',
+)
+
+ANALYSIS_KEYWORDS = (
+    'compare', 'comply', 'compliance', 'conflict', 'analy', 'explain why',
+    'difference between', 'interplay', 'both', 'scenario', 'should i',
+    'step by step', 'walk me through', 'enforce', 'appeal', 'hearing',
+)
+
+LOW_CONFIDENCE_MARKERS = (
+    "i'm not sure", 'i am not sure', 'not certain', 'unclear from',
+    'does not appear to', "doesn't appear to", 'not covered in',
+    'not addressed in', 'cannot determine', "can't determine",
+    'i cannot find', "i can't find", 'no specific provision',
+)
+
+
+def classify_query(query):
+    """Pick a route name for a query using cheap local heuristics"""
+    text = (query or '').strip().lower()
+    words = len(text.split())
+    section_refs = len(SECTION_REF_RE.findall(text))
+
+    analysis_hits = sum(1 for kw in ANALYSIS_KEYWORDS if kw in text)
+    lookup_hits = sum(1 for kw in LOOKUP_KEYWORDS if kw in text)
+
+    # Long multi-part questions or ones spanning several statutes
+    if words > 120 or section_refs >= 3 or (analysis_hits >= 2 and words > 40):
+        return 'extended'
+    if analysis_hits or section_refs >= 2 or words > 60:
+        return 'full'
+    if lookup_hits or section_refs == 1 or words <= 25:
+        return 'fast'
+    return 'full'
+
+
+def get_route(name):
+    """Return a copy of a route config with its name attached"""
+    route = dict(ROUTES.get(name, ROUTES['full']))
+    route['name'] = name if name in ROUTES else 'full'
+    return route
+
+
+def needs_escalation(route_name, response):
+    """Check whether a fast-route answer should be retried on the full model"""
+    if route_name != 'fast':
+        return False
+    if getattr(response, 'stop_reason', None) == 'max_tokens':
+        return True
+    try:
+        text = response.content[0].text.lower()
+    except (AttributeError, IndexError):
+        return True
+    return any(marker in text for marker in LOW_CONFIDENCE_MARKERS)
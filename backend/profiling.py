@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+# Fraction of requests profiled without being asked (0 disables)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 120))
+# At most this many requests are sampled at once, whatever triggers them
+PROFILE_MAX_CONCURRENT = int(os.getenv('PROFILE_MAX_CONCURRENT', 2))
+
+_local = threading.local()
+_profile_slots = threading.BoundedSemaphore(PROFILE_MAX_CONCURRENT)
+
+
+def start_request():
+    _local.spans = {}
+    _local.started = time.perf_counter()
+
+
+def record_span(name, seconds):
+    """Add time to a named span of the current request; a no-op outside requests"""
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def finish_request():
+    """Return the Server-Timing header value for the current request and reset"""
+    spans = getattr(_local, 'spans', None) or {}
+    started = getattr(_local, 'started', None)
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans.items()]
+    if started is not None:
+        parts.append(f"total;dur={(time.perf_counter() - started) * 1000:.1f}")
+    _local.spans = None
+    _local.started = None
+    return ', '.join(parts)
+
+
+def should_sample():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer and writes collapsed stacks.
+
+    Output is one "frame;frame;frame count" line per distinct stack, the format
+    read by flamegraph.pl and speedscope. Only runs while a profiled request is in
+    flight, so it costs nothing when idle.
+    """
+
+    def __init__(self, thread_id, label, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        self.thread_id = thread_id
+        self.label = label
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def write(self, directory=PROFILE_DIR):
+        if not self.stacks:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        safe_label = ''.join(c if c.isalnum() else '_' for c in self.label).strip('_')
+        path = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{safe_label}.collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def start_profile(label):
+    """Start sampling the current thread, or return None if all profile slots are busy"""
+    if not _profile_slots.acquire(blocking=False):
+        logger.info("Profile requested but all profiling slots are busy")
+        return None
+    sampler = StackSampler(threading.get_ident(), label)
+    sampler.start()
+    return sampler
+
+
+def stop_profile(sampler):
+    try:
+        sampler.stop()
+        path = sampler.write()
+        if path:
+            logger.info(f"Wrote request profile: {path}")
+        return path
+    except Exception as e:
+        logger.error(f"Error writing profile: {str(e)}")
+        return None
+    finally:
+        _profile_slots.release()
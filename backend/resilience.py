@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 2))
+DEFAULT_BASE_DELAY = float(os.getenv('UPSTREAM_RETRY_BASE_DELAY', 0.5))
+DEFAULT_MAX_DELAY = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', 4.0))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 30))
+
+# Below this much remaining budget it is not worth starting another attempt
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request budget runs out before an upstream call finishes"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream's circuit breaker is open and calls fail fast"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Tracks the time left in a request budget"""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None):
+        """Per-call timeout: what is left of the budget, optionally capped"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request budget of {self.budget}s exhausted")
+        return min(remaining, cap) if cap else remaining
+
+
+class CircuitBreaker:
+    """Per-upstream breaker: closed -> open after repeated failures -> half-open probe"""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self.probe_in_flight:
+                # Let a single probe through to test the upstream
+                self.probe_in_flight = True
+                return
+            retry_after = self.reset_seconds - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(self.name, max(retry_after, 1))
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probe_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probe_in_flight:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the shared circuit breaker for an upstream"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def backoff_delay(attempt, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_upstream(name, fn, deadline, is_retryable, max_retries=DEFAULT_MAX_RETRIES, timeout_cap=None):
+    """Call fn(timeout) through the upstream's breaker with bounded, jittered retries.
+
+    fn receives the per-attempt timeout in seconds, derived from the deadline.
+    """
+    breaker = get_breaker(name)
+    attempt = 0
+    while True:
+        # Before before_call: a half-open breaker hands out its single probe there,
+        # and a DeadlineExceeded after that would leave the probe claimed forever
+        timeout = deadline.timeout(timeout_cap)
+        breaker.before_call()
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                # Client errors say nothing about upstream health
+                breaker.record_success()
+            if not retryable or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline.remaining() - delay < MIN_ATTEMPT_SECONDS:
+                raise
+            logger.warning(f"{name} call failed ({type(e).__name__}), retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+def is_retryable_anthropic_error(error):
+    import anthropic
+    if isinstance(error, (anthropic.APITimeoutError, anthropic.APIConnectionError, anthropic.RateLimitError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        # 5xx and 529 overloaded
+        return error.status_code >= 500
+    return False
+
+
+def is_retryable_stripe_error(error):
+    import stripe
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    if isinstance(error, stripe.error.APIError):
+        return (getattr(error, 'http_status', None) or 500) >= 500
+    return False
@@ -0,0 +1,231 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+from profiling import record_span
+
+logger = logging.getLogger(__name__)
+
+# Model calls allowed in flight at once per worker process
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+# Waiting requests across all tiers before the lowest tier is shed
+QUEUE_LIMIT = int(os.getenv('LLM_QUEUE_LIMIT', 32))
+
+# Lower priority number is served first. max_share caps the slots a tier may hold
+# so higher tiers always have headroom; max_wait is the tier's queue-time SLO,
+# after which the request is shed instead of waiting further.
+TIER_SCHEDULE = {
+    'paid': {
+        'priority': 0,
+        'max_share': 1.0,
+        'max_wait': float(os.getenv('LLM_PAID_MAX_WAIT', 30)),
+    },
+    'free': {
+        'priority': 1,
+        'max_share': float(os.getenv('LLM_FREE_MAX_SHARE', 0.5)),
+        'max_wait': float(os.getenv('LLM_FREE_MAX_WAIT', 5)),
+    },
+}
+DEFAULT_TIER = 'free'
+
+# Recent queue waits kept per tier for the percentiles in stats()
+WAIT_SAMPLES = 500
+
+
+class AdmissionRejected(Exception):
+    """Raised when a model call is shed instead of admitted"""
+
+    def __init__(self, tier, reason, retry_after):
+        super().__init__(f"{tier} request shed ({reason}), retry in {retry_after}s")
+        self.tier = tier
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('tier', 'enqueued_at', 'granted', 'shed')
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.shed = None
+
+
+class AdmissionScheduler:
+    """Priority admission for model calls, keyed by subscription tier.
+
+    A fixed number of slots is shared between tiers. Free slots go to the highest
+    priority tier with waiters that is under its share cap, FIFO within a tier.
+    When the queue is full the newest waiter of the lowest tier is shed, and a
+    waiter that outlives its tier's max_wait is shed rather than left to time out.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, queue_limit=QUEUE_LIMIT, tiers=TIER_SCHEDULE):
+        self.max_concurrency = max_concurrency
+        self.queue_limit = queue_limit
+        self.tiers = tiers
+        self.order = sorted(tiers, key=lambda name: tiers[name]['priority'])
+        self.caps = {
+            name: max(1, int(max_concurrency * config['max_share']))
+            for name, config in tiers.items()
+        }
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.queues = {name: deque() for name in tiers}
+        self.stats_by_tier = {
+            name: {'in_flight': 0, 'admitted': 0, 'shed': 0, 'waits': deque(maxlen=WAIT_SAMPLES)}
+            for name in tiers
+        }
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.avg_service = 5.0
+
+    def resolve_tier(self, tier):
+        # Unknown or missing tiers (e.g. the quota check failed open) get the lowest share
+        return tier if tier in self.tiers else DEFAULT_TIER
+
+    def can_run(self, tier):
+        return self.in_flight < self.max_concurrency and self.stats_by_tier[tier]['in_flight'] < self.caps[tier]
+
+    def dispatch(self):
+        # Caller holds cond
+        granted = False
+        for tier in self.order:
+            queue = self.queues[tier]
+            while queue and self.can_run(tier):
+                waiter = queue.popleft()
+                self.grant(waiter)
+                granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def grant(self, waiter):
+        waiter.granted = True
+        self.in_flight += 1
+        stats = self.stats_by_tier[waiter.tier]
+        stats['in_flight'] += 1
+        stats['admitted'] += 1
+        stats['waits'].append(time.monotonic() - waiter.enqueued_at)
+
+    def retry_after(self):
+        queued = sum(len(queue) for queue in self.queues.values())
+        return max(1, math.ceil(self.avg_service * (queued + 1) / self.max_concurrency))
+
+    def reject(self, tier, reason):
+        self.stats_by_tier[tier]['shed'] += 1
+        logger.warning(f"Shedding {tier} model call: {reason}")
+        return AdmissionRejected(tier, reason, self.retry_after())
+
+    def make_room(self, tier):
+        """Shed the newest waiter of a lower tier; False if nothing lower is queued"""
+        priority = self.tiers[tier]['priority']
+        for lower in reversed(self.order):
+            if self.tiers[lower]['priority'] <= priority:
+                return False
+            if self.queues[lower]:
+                victim = self.queues[lower].pop()
+                victim.shed = 'displaced by higher tier'
+                self.cond.notify_all()
+                return True
+        return False
+
+    def acquire(self, tier, deadline=None):
+        """Block until a slot is free for this tier; raises AdmissionRejected if shed"""
+        tier = self.resolve_tier(tier)
+        max_wait = self.tiers[tier]['max_wait']
+        if deadline is not None:
+            max_wait = min(max_wait, deadline.remaining())
+        start = time.monotonic()
+
+        with self.cond:
+            # Run straight away unless a waiter of the same or higher priority is ahead
+            priority = self.tiers[tier]['priority']
+            ahead = any(self.queues[name] for name in self.order if self.tiers[name]['priority'] <= priority)
+            if not ahead and self.can_run(tier):
+                self.grant(_Waiter(tier))
+                return tier
+
+            # Only a request that really has to queue may displace a lower-tier waiter
+            queued = sum(len(queue) for queue in self.queues.values())
+            if queued >= self.queue_limit and not self.make_room(tier):
+                raise self.reject(tier, 'queue full')
+
+            waiter = _Waiter(tier)
+            self.queues[tier].append(waiter)
+            self.dispatch()
+            give_up_at = start + max_wait
+            while not waiter.granted and waiter.shed is None:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    self.queues[tier].remove(waiter)
+                    waiter.shed = f"waited over {max_wait:.0f}s"
+                    break
+                self.cond.wait(remaining)
+            record_span('queue', time.monotonic() - start)
+            if not waiter.granted:
+                raise self.reject(tier, waiter.shed)
+        return tier
+
+    def release(self, tier, held_seconds):
+        with self.cond:
+            self.in_flight -= 1
+            self.stats_by_tier[tier]['in_flight'] -= 1
+            self.avg_service = 0.9 * self.avg_service + 0.1 * held_seconds
+            self.dispatch()
+
+    def slot(self, tier, deadline=None):
+        return _Slot(self, tier, deadline)
+
+    def stats(self):
+        """Queue depth, in-flight calls, shed counts and recent queue waits per tier"""
+        with self.cond:
+            tiers = {}
+            for name in self.order:
+                stats = self.stats_by_tier[name]
+                waits = sorted(stats['waits'])
+                tiers[name] = {
+                    'queued': len(self.queues[name]),
+                    'in_flight': stats['in_flight'],
+                    'max_in_flight': self.caps[name],
+                    'max_wait_seconds': self.tiers[name]['max_wait'],
+                    'admitted': stats['admitted'],
+                    'shed': stats['shed'],
+                    'wait_p50_ms': round(percentile(waits, 0.5) * 1000, 1),
+                    'wait_p95_ms': round(percentile(waits, 0.95) * 1000, 1),
+                    'wait_max_ms': round((waits[-1] if waits else 0.0) * 1000, 1),
+                }
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'queue_limit': self.queue_limit,
+                'avg_service_seconds': round(self.avg_service, 2),
+                'tiers': tiers,
+            }
+
+
+class _Slot:
+    def __init__(self, scheduler, tier, deadline):
+        self.scheduler = scheduler
+        self.tier = tier
+        self.deadline = deadline
+
+    def __enter__(self):
+        self.tier = self.scheduler.acquire(self.tier, self.deadline)
+        self.acquired_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.scheduler.release(self.tier, time.monotonic() - self.acquired_at)
+        return False
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+scheduler = AdmissionScheduler()
@@ -0,0 +1,198 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LAWS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'mass_weights_measures_laws.txt')
+
+CHAPTER_RE = re.compile(r'^CHAPTER\s+(\d+[A-Z]?)\s*$')
+APPENDIX_RE = re.compile(r'^APPENDIX\s+\d+\s*$')
+SECTION_RE = re.compile(r'^Section\s+(\d+[A-Z]*)\s*([.:])\s*(.*)$')
+
+# Citation forms: "Section 295C", "sec. 184D", "§ 295C", "c. 94 § 1", "chapter 98 section 29A"
+CITE_CHAPTER_RE = re.compile(r'\b(?:chapter|ch\.?|c\.)\s*(\d+[a-z]?)\b', re.IGNORECASE)
+CITE_SECTION_RE = re.compile(r'(?:\bsection|\bsec\.?|§{1,2})\s*(\d+[a-z]*)\b', re.IGNORECASE)
+BARE_SECTION_RE = re.compile(r'\b(\d+[a-z]{1,2})\b', re.IGNORECASE)
+
+# Words that can surround a citation without making it more than a lookup
+LOOKUP_WORDS = {
+    'show', 'me', 'what', 'does', 'do', 'say', 'says', 'said', 'text', 'of', 'the', 'read',
+    'full', 'give', 'display', 'section', 'sections', 'sec', 'chapter', 'ch', 'c', 'mgl', 'm', 'g', 'l',
+    'please', 'is', 'in', 'a', 'an', 'for', 'to', 'under', 'pull', 'up', 'print', 'quote',
+    'verbatim', 'exact', 'wording', 'language', 'law', 'statute', 'can', 'you', 'i', 'need',
+    'see', 'look', 'find', 'get', 'lookup', 'summarize', 'summary', 'briefly', 'and',
+    'definitions', 'definition', 'defined',
+}
+
+SUMMARY_WORDS = ('summarize', 'summary', 'summarise', 'in short', 'briefly')
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+_corpus_version = None
+_corpus_version_mtime = None
+
+
+def build_section_index(text):
+    """Split the laws corpus into {(chapter, section): entry} from its headings"""
+    index = {}
+    chapter = None
+    heading = None
+    current = None
+
+    def close():
+        if current is not None:
+            current['text'] = '\n'.join(current['lines']).strip()
+            del current['lines']
+
+    # Skip the table of contents: the body starts at the first bare CHAPTER line
+    lines = text.splitlines()
+    start = next((i for i, line in enumerate(lines) if CHAPTER_RE.match(line)), len(lines))
+
+    for line in lines[start:]:
+        stripped = line.strip()
+        chapter_match = CHAPTER_RE.match(stripped)
+        if chapter_match or APPENDIX_RE.match(stripped):
+            close()
+            current = None
+            heading = None
+            chapter = chapter_match.group(1) if chapter_match else None
+            continue
+        if chapter is None:
+            continue
+
+        section_match = SECTION_RE.match(stripped)
+        if section_match:
+            number, separator, rest = section_match.group(1).upper(), section_match.group(2), section_match.group(3).strip()
+            if current is None or current['section'] != number:
+                close()
+                key = (chapter, number)
+                if key in index:
+                    # Chapter 94 appears twice in the corpus; keep appending
+                    current = index[key]
+                    current['lines'] = [current.pop('text')]
+                else:
+                    current = {
+                        'chapter': chapter,
+                        'section': number,
+                        # "Section 295C: Title" or a short "Section 5. Title." heading line
+                        'title': rest if separator == ':' or len(rest) < 100 else None,
+                        'heading': heading,
+                        'lines': [],
+                    }
+                    index[key] = current
+            current['lines'].append(stripped)
+            continue
+
+        # Upper-case sub-headings (BREAD, FISH, ...) end the section above them
+        if stripped and stripped.isupper() and len(stripped) > 2 and not stripped[0].isdigit():
+            close()
+            current = None
+            heading = stripped
+            continue
+
+        if current is not None:
+            current['lines'].append(line.rstrip())
+
+    close()
+    return index
+
+
+def get_section_index():
+    """Return the section index, rebuilding it if the corpus file changed"""
+    global _index, _index_mtime
+    mtime = os.path.getmtime(LAWS_FILE)
+    with _index_lock:
+        if _index is None or mtime != _index_mtime:
+            with open(LAWS_FILE, 'r', encoding='utf-8') as f:
+                _index = build_section_index(f.read())
+            _index_mtime = mtime
+            logger.info(f"Built statute section index: {len(_index)} sections")
+        return _index
+
+
+def get_corpus_version():
+    """Short content hash of the laws corpus; changes whenever the text does"""
+    global _corpus_version, _corpus_version_mtime
+    mtime = os.path.getmtime(LAWS_FILE)
+    with _index_lock:
+        if _corpus_version is None or mtime != _corpus_version_mtime:
+            with open(LAWS_FILE, 'rb') as f:
+                _corpus_version = hashlib.sha256(f.read()).hexdigest()[:16]
+            _corpus_version_mtime = mtime
+        return _corpus_version
+
+
+def find_sections(section=None, chapter=None, topic=None):
+    """Look up sections by number and/or chapter; topic matches titles and sub-headings"""
+    results = []
+    for (ch, sec), entry in get_section_index().items():
+        if chapter and ch != chapter.upper():
+            continue
+        if section and sec != section.upper():
+            continue
+        if topic:
+            label = f"{entry['title'] or ''} {entry['heading'] or ''}".lower()
+            if topic.lower() not in label:
+                continue
+        results.append(entry)
+    return results
+
+
+def parse_citation(query):
+    """Pull (chapter, section) out of a query; either may be None"""
+    chapter_match = CITE_CHAPTER_RE.search(query or '')
+    section_match = CITE_SECTION_RE.search(query or '')
+    chapter = chapter_match.group(1).upper() if chapter_match else None
+    section = section_match.group(1).upper() if section_match else None
+    if section is None:
+        # "what does 184D say": a bare number with a letter suffix
+        for bare in BARE_SECTION_RE.findall(query or ''):
+            if not chapter_match or bare.upper() != chapter:
+                section = bare.upper()
+                break
+    return chapter, section
+
+
+def is_citation_lookup(query):
+    """True when the query is nothing more than a request for a cited section"""
+    chapter, section = parse_citation(query)
+    if not chapter and not section:
+        return False
+    words = re.findall(r'[a-z]+', re.sub(r'\d+[a-z]*', ' ', (query or '').lower()))
+    if len(words) > 12:
+        return False
+    return all(word in LOOKUP_WORDS for word in words)
+
+
+def wants_summary(query):
+    text = (query or '').lower()
+    return any(word in text for word in SUMMARY_WORDS)
+
+
+def lookup_citation(query):
+    """Resolve a citation query to matching sections"""
+    chapter, section = parse_citation(query)
+    if section:
+        return find_sections(section=section, chapter=chapter)
+    if chapter and 'definition' in (query or '').lower():
+        return find_sections(chapter=chapter, topic='definition')
+    return []
+
+
+def section_id(entry):
+    return f"{entry['chapter']}-{entry['section']}"
+
+
+def serialize_section(entry):
+    return {
+        'id': section_id(entry),
+        'chapter': entry['chapter'],
+        'section': entry['section'],
+        'title': entry['title'],
+        'heading': entry['heading'],
+        'text': entry['text'],
+    }
@@ -0,0 +1,31 @@
+import time
+import unittest
+
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, call_upstream, get_breaker
+
+
+class HalfOpenProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = get_breaker('test-half-open')
+        self.breaker.failures = self.breaker.failure_threshold
+        # Opened long enough ago that the breaker is half-open
+        self.breaker.opened_at = time.monotonic() - self.breaker.reset_seconds - 1
+        self.breaker.probe_in_flight = False
+
+    def test_expired_deadline_does_not_claim_the_probe(self):
+        with self.assertRaises(DeadlineExceeded):
+            call_upstream('test-half-open', lambda timeout: 'ok', Deadline(0), lambda e: True)
+        self.assertFalse(self.breaker.probe_in_flight)
+        self.assertEqual(call_upstream('test-half-open', lambda timeout: 'ok', Deadline(5), lambda e: True), 'ok')
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_only_one_probe_while_half_open(self):
+        breaker = CircuitBreaker('standalone', failure_threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+
+if __name__ == '__main__':
+    unittest.main()
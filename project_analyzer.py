@@ -5,10 +5,32 @@ Drop this script into any project directory to get a quick overview.
 """
 
 import os
+import stat
 import json
+import mmap
+import heapq
+import hashlib
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Common ignore patterns, matched against individual path components
+IGNORE_PATTERNS = [
+    'node_modules', '__pycache__', '.git', '.vscode', '.idea',
+    'venv', 'env', '.env', 'dist', 'build', '.next',
+    '.cache', 'coverage', '.pytest_cache', '.mypy_cache',
+    'target', 'bin', 'obj', '.vs'
+]
+
+CACHE_FILE_NAME = '.project_analyzer_cache.json'
+LARGEST_FILES_LIMIT = 10
+
+# Duplicate detection: bytes read from each end of a file for the partial hash,
+# read size for full hashes, and the smallest candidate batch worth a process pool
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+MIN_POOL_BATCH = 16
 
 def get_file_size_human_readable(size_bytes):
     """Convert bytes to human readable format"""
@@ -21,13 +43,14 @@ def get_file_size_human_readable(size_bytes):
         i += 1
     return f"{size_bytes:.2f} {size_names[i]}"
 
+def compile_ignore_patterns(ignore_patterns):
+    """Build a set for O(1) lookups of ignored path components"""
+    return frozenset(pattern.lower() for pattern in ignore_patterns)
+
 def should_ignore(path, ignore_patterns):
-    """Check if path should be ignored"""
-    path_str = str(path).lower()
-    for pattern in ignore_patterns:
-        if pattern in path_str:
-            return True
-    return False
+    """Check if any component of path is ignored"""
+    ignore_names = ignore_patterns if isinstance(ignore_patterns, frozenset) else compile_ignore_patterns(ignore_patterns)
+    return any(part.lower() in ignore_names for part in Path(path).parts)
 
 def extract_dependencies_from_requirements(project_root):
     """Extract dependencies from requirements.txt files"""
@@ -89,20 +112,104 @@ def get_project_type(project_root, files, dirs):
     
     return project_types if project_types else ['Unknown']
 
-def analyze_project(project_root=None):
-    """Analyze project structure and generate report"""
+def scan_directory(dir_path, ignore_names, cached=None):
+    """Scan one directory with os.scandir, reusing the cached listing if its mtime is unchanged"""
+    try:
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+    except OSError:
+        return None
+    if cached and cached.get('mtime_ns') == mtime_ns:
+        return cached
+    
+    files = []
+    dirs = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.name.lower() in ignore_names:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        # DirEntry caches stat results, so this is usually free on Windows
+                        files.append([entry.name, entry.stat().st_size])
+                except OSError:
+                    continue
+    except (OSError, PermissionError):
+        return None
+    
+    return {'mtime_ns': mtime_ns, 'files': files, 'dirs': dirs}
+
+def walk_project(project_root, ignore_names, cache, workers=1):
+    """Yield (relative_dir, listing) for every non-ignored directory.
+    
+    With workers > 1, directory scans run on a thread pool so sibling subtrees
+    are listed in parallel; scandir/stat release the GIL while they wait on disk.
+    """
+    def scan(rel_dir):
+        return rel_dir, scan_directory(project_root / rel_dir, ignore_names, cache.get(str(rel_dir)))
+    
+    root = Path('.')
+    if workers <= 1:
+        stack = [root]
+        while stack:
+            rel_dir, listing = scan(stack.pop())
+            if listing is None:
+                continue
+            yield rel_dir, listing
+            stack.extend(rel_dir / d for d in listing['dirs'])
+        return
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(scan, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel_dir, listing = future.result()
+                if listing is None:
+                    continue
+                yield rel_dir, listing
+                pending.update(pool.submit(scan, rel_dir / d) for d in listing['dirs'])
+
+def load_walk_cache(cache_file, ignore_names):
+    """Load the per-directory listing cache; discard it if the ignore list changed"""
+    if not cache_file or not Path(cache_file).exists():
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('ignore') != sorted(ignore_names):
+            return {}
+        return data.get('dirs', {})
+    except (OSError, ValueError):
+        return {}
+
+def save_walk_cache(cache_file, ignore_names, dirs):
+    try:
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump({'ignore': sorted(ignore_names), 'dirs': dirs}, f)
+    except OSError as e:
+        print(f"⚠️ Could not write cache {cache_file}: {e}")
+
+def analyze_project(project_root=None, workers=1, use_cache=True, cache_file=None, collect_sizes=False):
+    """Analyze project structure and generate report
+    
+    Directory listings are cached on disk keyed by directory mtime, so re-runs only
+    rescan directories whose entries changed. A file edited in place keeps its
+    directory's mtime, so its size can be stale until the cache is refreshed
+    (pass use_cache=False or --no-cache).
+    """
     if project_root is None:
         project_root = Path.cwd()
     else:
         project_root = Path(project_root)
     
-    # Common ignore patterns
-    ignore_patterns = [
-        'node_modules', '__pycache__', '.git', '.vscode', '.idea',
-        'venv', 'env', '.env', 'dist', 'build', '.next',
-        '.cache', 'coverage', '.pytest_cache', '.mypy_cache',
-        'target', 'bin', 'obj', '.vs'
-    ]
+    if cache_file is None:
+        cache_file = project_root / CACHE_FILE_NAME
+    ignore_names = compile_ignore_patterns(IGNORE_PATTERNS + [Path(cache_file).name])
+    cache = load_walk_cache(cache_file, ignore_names) if use_cache else {}
+    new_cache = {}
     
     stats = {
         'total_files': 0,
@@ -111,70 +218,161 @@ def analyze_project(project_root=None):
         'file_extensions': Counter(),
         'largest_files': [],
         'directories': [],
-        'files_by_dir': defaultdict(list)
+        'files_by_dir': defaultdict(list),
+        'files_by_size': defaultdict(list)
     }
     
-    # Walk through directory
-    for root, dirs, files in os.walk(project_root):
-        root_path = Path(root)
-        relative_root = root_path.relative_to(project_root)
-        
-        # Skip ignored directories
-        if should_ignore(relative_root, ignore_patterns):
-            continue
-        
-        # Filter out ignored subdirectories
-        dirs[:] = [d for d in dirs if not should_ignore(root_path / d, ignore_patterns)]
-        
-        stats['total_dirs'] += len(dirs)
+    # Min-heap of (size, path) holding only the current top N
+    largest = []
+    
+    for relative_root, listing in walk_project(project_root, ignore_names, cache, workers):
+        new_cache[str(relative_root)] = listing
+        stats['total_dirs'] += len(listing['dirs'])
+        rel_dir = str(relative_root) if str(relative_root) != '.' else 'root'
         
-        for file in files:
-            file_path = root_path / file
+        for name, size in listing['files']:
+            stats['total_files'] += 1
+            stats['total_size'] += size
             
-            if should_ignore(file_path, ignore_patterns):
-                continue
+            # File extension
+            suffix = os.path.splitext(name)[1].lower()
+            stats['file_extensions'][suffix or '(no extension)'] += 1
             
-            try:
-                size = file_path.stat().st_size
-                stats['total_files'] += 1
-                stats['total_size'] += size
-                
-                # File extension
-                ext = file_path.suffix.lower() if file_path.suffix else '(no extension)'
-                stats['file_extensions'][ext] += 1
-                
-                # Track files by directory
-                rel_dir = str(relative_root) if str(relative_root) != '.' else 'root'
-                stats['files_by_dir'][rel_dir].append({
-                    'name': file,
-                    'size': size,
-                    'size_human': get_file_size_human_readable(size)
-                })
-                
-                # Track largest files
-                stats['largest_files'].append({
-                    'path': str(file_path.relative_to(project_root)),
-                    'size': size,
-                    'size_human': get_file_size_human_readable(size)
-                })
-                
-            except (OSError, PermissionError):
-                continue
+            # Track files by directory
+            stats['files_by_dir'][rel_dir].append({
+                'name': name,
+                'size': size,
+                'size_human': get_file_size_human_readable(size)
+            })
+            
+            if collect_sizes:
+                stats['files_by_size'][size].append(str(relative_root / name))
+            
+            # Track largest files
+            item = (size, str(relative_root / name))
+            if len(largest) < LARGEST_FILES_LIMIT:
+                heapq.heappush(largest, item)
+            elif item > largest[0]:
+                heapq.heapreplace(largest, item)
     
-    # Sort largest files
-    stats['largest_files'].sort(key=lambda x: x['size'], reverse=True)
-    stats['largest_files'] = stats['largest_files'][:10]  # Top 10
+    stats['largest_files'] = [
+        {'path': path, 'size': size, 'size_human': get_file_size_human_readable(size)}
+        for size, path in sorted(largest, reverse=True)
+    ]
+    
+    if use_cache:
+        save_walk_cache(cache_file, ignore_names, new_cache)
     
     # Get project info
-    root_files = [f.name for f in project_root.iterdir() if f.is_file()]
-    root_dirs = [f.name for f in project_root.iterdir() if f.is_dir() and not should_ignore(f, ignore_patterns)]
+    root_listing = new_cache.get('.', {'files': [], 'dirs': []})
+    root_files = [name for name, _ in root_listing['files']]
+    root_dirs = list(root_listing['dirs'])
     
     project_types = get_project_type(project_root, root_files, root_dirs)
     dependencies = extract_dependencies_from_requirements(project_root)
     
     return stats, project_types, dependencies, root_files, root_dirs
 
-def generate_report(project_root=None, output_file=None):
+def partial_hash(path):
+    """Hash the size plus the first and last PARTIAL_HASH_BYTES of a file"""
+    try:
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            digest.update(str(size).encode())
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+            if size > PARTIAL_HASH_BYTES * 2:
+                f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+                digest.update(f.read(PARTIAL_HASH_BYTES))
+            elif size > PARTIAL_HASH_BYTES:
+                digest.update(f.read())
+        return path, digest.hexdigest()
+    except OSError:
+        return path, None
+
+def full_hash(path):
+    """Hash a whole file, through mmap where possible"""
+    try:
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return path, digest.hexdigest()
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for offset in range(0, size, HASH_CHUNK_BYTES):
+                        digest.update(mapped[offset:offset + HASH_CHUNK_BYTES])
+            except (OSError, ValueError):
+                for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+                    digest.update(chunk)
+        return path, digest.hexdigest()
+    except OSError:
+        return path, None
+
+def hash_files(hash_func, paths, workers):
+    """Run hash_func over paths, in a process pool when the batch is big enough"""
+    if workers <= 1 or len(paths) < MIN_POOL_BATCH:
+        return [hash_func(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_func, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+def regroup(groups, hash_func, workers):
+    """Split each candidate group by hash, keeping only groups that still collide"""
+    paths = [path for group in groups for path in group]
+    buckets = defaultdict(list)
+    for path, digest in hash_files(hash_func, paths, workers):
+        if digest is not None:
+            buckets[digest].append(path)
+    return {digest: group for digest, group in buckets.items() if len(group) > 1}
+
+def distinct_files(paths):
+    """Drop symlinks and extra hard links, which share storage and free nothing if removed"""
+    seen = set()
+    distinct = []
+    for path in paths:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        if stat.S_ISLNK(st.st_mode) or (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        distinct.append(path)
+    return distinct
+
+def find_duplicates(project_root, files_by_size, workers=1, min_size=1):
+    """Find identical files: group by size, then partial hash, then full hash.
+    
+    Only files that share a size are ever opened, and only partial-hash
+    collisions are read in full. Symlinks and hard links to the same file are
+    not duplicates, so they are dropped before hashing.
+    """
+    project_root = Path(project_root)
+    candidates = [
+        distinct_files([str(project_root / path) for path in paths])
+        for size, paths in files_by_size.items()
+        if size >= min_size and len(paths) > 1
+    ]
+    candidates = [paths for paths in candidates if len(paths) > 1]
+    
+    partial_groups = regroup(candidates, partial_hash, workers)
+    full_groups = regroup(partial_groups.values(), full_hash, workers)
+    
+    duplicates = []
+    for digest, paths in full_groups.items():
+        size = os.path.getsize(paths[0])
+        duplicates.append({
+            'hash': digest,
+            'size': size,
+            'size_human': get_file_size_human_readable(size),
+            'wasted': size * (len(paths) - 1),
+            'paths': sorted(str(Path(path).relative_to(project_root)) for path in paths)
+        })
+    duplicates.sort(key=lambda group: group['wasted'], reverse=True)
+    return duplicates
+
+def generate_report(project_root=None, output_file=None, workers=1, use_cache=True,
+                    duplicates=False, json_file=None, min_dup_size=1):
     """Generate and save project analysis report"""
     if project_root is None:
         project_root = Path.cwd()
@@ -184,7 +382,14 @@ def generate_report(project_root=None, output_file=None):
     if output_file is None:
         output_file = project_root / f"{project_root.name}_structure.md"
     
-    stats, project_types, dependencies, root_files, root_dirs = analyze_project(project_root)
+    stats, project_types, dependencies, root_files, root_dirs = analyze_project(
+        project_root, workers, use_cache, collect_sizes=duplicates
+    )
+    
+    duplicate_groups = []
+    if duplicates:
+        print("🔁 Checking for duplicate files...")
+        duplicate_groups = find_duplicates(project_root, stats['files_by_size'], workers, min_dup_size)
     
     # Generate report
     report = []
@@ -244,6 +449,31 @@ def generate_report(project_root=None, output_file=None):
         for file_info in stats['largest_files'][:5]:
             report.append(f"- **{file_info['path']}**: {file_info['size_human']}")
     
+    # Duplicate files
+    if duplicates:
+        wasted = sum(group['wasted'] for group in duplicate_groups)
+        report.append(f"\n## Duplicate Files")
+        report.append(f"**Groups**: {len(duplicate_groups)}")
+        report.append(f"**Reclaimable**: {get_file_size_human_readable(wasted)}")
+        for group in duplicate_groups[:20]:
+            report.append(f"- {group['size_human']} × {len(group['paths'])}: {', '.join(f'`{path}`' for path in group['paths'])}")
+        if len(duplicate_groups) > 20:
+            report.append(f"... and {len(duplicate_groups) - 20} more groups")
+        
+        if json_file is None:
+            json_file = Path(output_file).with_name(f"{project_root.name}_duplicates.json")
+        try:
+            with open(json_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'project': str(project_root),
+                    'generated': datetime.now().isoformat(),
+                    'reclaimable_bytes': wasted,
+                    'groups': duplicate_groups
+                }, f, indent=2)
+            print(f"✅ Duplicates written: {json_file}")
+        except Exception as e:
+            print(f"❌ Error writing duplicates JSON: {e}")
+    
     # Write report
     report_content = '\n'.join(report)
     
@@ -257,14 +487,21 @@ def generate_report(project_root=None, output_file=None):
         return None
 
 if __name__ == "__main__":
-    import sys
+    import argparse
     
-    # Get project path from command line or use current directory
-    project_path = sys.argv[1] if len(sys.argv) > 1 else None
-    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    parser = argparse.ArgumentParser(description="Generate a markdown overview of a project's structure")
+    parser.add_argument('project_path', nargs='?', help='Project directory (default: current directory)')
+    parser.add_argument('output_path', nargs='?', help='Report file (default: <project>_structure.md)')
+    parser.add_argument('--workers', type=int, default=1, help='Threads used to scan directories, and processes used to hash files with --duplicates')
+    parser.add_argument('--no-cache', action='store_true', help='Rescan every directory and skip the on-disk cache')
+    parser.add_argument('--duplicates', action='store_true', help='Detect duplicate files (size, then partial hash, then full hash)')
+    parser.add_argument('--json', dest='json_path', help='Duplicates JSON file (default: <project>_duplicates.json)')
+    parser.add_argument('--min-dup-size', type=int, default=1, help='Ignore duplicates smaller than this many bytes')
+    args = parser.parse_args()
     
     print("🔍 Analyzing project structure...")
-    result = generate_report(project_path, output_path)
+    result = generate_report(args.project_path, args.output_path, args.workers, not args.no_cache,
+                             args.duplicates, args.json_path, args.min_dup_size)
     
     if result:
         print(f"📁 Analysis complete! Check: {result}")
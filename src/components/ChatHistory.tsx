@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useUser } from '@clerk/clerk-react';
-import { API_BASE } from '../config';
+import { API_BASE, apiFetch, fetchBootstrap } from '../config';
 import './ChatHistory.css';
 
 interface ChatSession {
@@ -25,10 +25,15 @@ const ChatHistory = ({ onSelectSession, currentSessionId }: ChatHistoryProps) =>
     
     try {
       setLoading(true);
-      const response = await fetch(`${API_BASE}/api/chat-history?user_id=${user.id}`);
-      if (response.ok) {
-        const data = await response.json();
-        setSessions(data.sessions || []);
+      // The first page comes with the bootstrap request; only long histories need the full list
+      const bootstrap = await fetchBootstrap(user.id);
+      setSessions(bootstrap.sessions);
+      if (bootstrap.has_more_sessions) {
+        const response = await apiFetch(`${API_BASE}/api/chat-history?user_id=${user.id}`);
+        if (response.ok) {
+          const data = await response.json();
+          setSessions(data.sessions || []);
+        }
       }
     } catch (error) {
       console.error('Error fetching chat history:', error);
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useUser } from '@clerk/clerk-react';
-import { API_BASE } from '../config';
+import { API_BASE, apiFetch, fetchBootstrap } from '../config';
 import PWAInstall from './PWAInstall';
 import './UserProfile.css';
 
@@ -59,13 +59,8 @@ const UserProfile = () => {
     
     try {
       setLoading(true);
-      const response = await fetch(`${API_BASE}/api/usage?user_id=${user.id}`);
-      
-      if (!response.ok) {
-        throw new Error(`Error fetching usage data: ${response.status}`);
-      }
-      
-      const data = await response.json();
+      // Shares the cold-start request with ChatHistory; unchanged data comes back as a 304
+      const data = await fetchBootstrap(user.id);
       setUsageData(data);
       setSelectedTier(data.subscription_tier);
     } catch (err) {
@@ -82,7 +77,7 @@ const UserProfile = () => {
       setLoading(true);
       // If downgrading to free tier, process immediately
       if (selectedTier === 'free') {
-        const response = await fetch(`${API_BASE}/api/subscribe`, {
+        const response = await apiFetch(`${API_BASE}/api/subscribe`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -100,7 +95,7 @@ const UserProfile = () => {
         alert(`Your subscription has been updated to ${selectedTier} tier!`);
       } else {
         // For paid tiers, redirect to Stripe Checkout
-        const response = await fetch(`${API_BASE}/api/create-checkout-session`, {
+        const response = await apiFetch(`${API_BASE}/api/create-checkout-session`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -12,4 +12,96 @@ const getAPIBase = () => {
     : '';
 };
 
-export const API_BASE = getAPIBase();
\ No newline at end of file
+export const API_BASE = getAPIBase();
+
+// Read-your-writes: the backend stamps responses that wrote data with X-Last-Write.
+// Sending it back for a few seconds keeps our reads off lagging read replicas,
+// whichever backend worker serves them.
+const LAST_WRITE_KEY = 'lastWrite';
+
+export const apiFetch = async (input: string, init: RequestInit = {}): Promise<Response> => {
+  const headers = new Headers(init.headers);
+  const lastWrite = localStorage.getItem(LAST_WRITE_KEY);
+  if (lastWrite) {
+    headers.set('X-Last-Write', lastWrite);
+  }
+  const response = await fetch(input, { ...init, headers });
+  const written = response.headers.get('X-Last-Write');
+  if (written) {
+    localStorage.setItem(LAST_WRITE_KEY, written);
+  }
+  return response;
+};
+
+// Cold-start data (profile, usage, recent queries, first history page) comes from
+// one /api/bootstrap request. The last response is kept with its ETag so a reload
+// revalidates with If-None-Match and gets a bodyless 304 when nothing changed.
+export interface BootstrapData {
+  user_id: string;
+  email: string | null;
+  name: string | null;
+  subscription_tier: string;
+  subscription_end_date: string | null;
+  tier_limits: { [tier: string]: { daily: number; monthly: number } };
+  usage: {
+    daily: number;
+    daily_limit: number;
+    monthly: number;
+    monthly_limit: number;
+    total: number;
+  };
+  recent_queries: {
+    query: string;
+    scope: string;
+    tokens_used: number;
+    created_at: string;
+  }[];
+  sessions: {
+    id: number;
+    title: string;
+    created_at: string;
+    updated_at: string;
+  }[];
+  session_count: number;
+  has_more_sessions: boolean;
+}
+
+const BOOTSTRAP_KEY = 'bootstrap';
+const bootstrapRequests = new Map<string, Promise<BootstrapData>>();
+
+const loadBootstrap = async (userId: string): Promise<BootstrapData> => {
+  const key = `${BOOTSTRAP_KEY}:${userId}`;
+  let cached: { etag: string; data: BootstrapData } | null = null;
+  try {
+    cached = JSON.parse(localStorage.getItem(key) || 'null');
+  } catch {
+    localStorage.removeItem(key);
+  }
+
+  const response = await apiFetch(`${API_BASE}/api/bootstrap?user_id=${userId}`, {
+    headers: cached ? { 'If-None-Match': cached.etag } : {},
+  });
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+  if (!response.ok) {
+    throw new Error(`Error fetching bootstrap data: ${response.status}`);
+  }
+
+  const data: BootstrapData = await response.json();
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    localStorage.setItem(key, JSON.stringify({ etag, data }));
+  }
+  return data;
+};
+
+// Components mounting together share one request
+export const fetchBootstrap = (userId: string): Promise<BootstrapData> => {
+  let pending = bootstrapRequests.get(userId);
+  if (!pending) {
+    pending = loadBootstrap(userId).finally(() => bootstrapRequests.delete(userId));
+    bootstrapRequests.set(userId, pending);
+  }
+  return pending;
+};